@@ -1,78 +1,163 @@
 import os
 import requests
-from api.SonarrResponse import SonarrResponse
-from api.RadarrResponse import RadarrResponse
-from enum import Enum
+from api.http_client import HttpClient
+from api.QueueResponse import QueueResponse
+from pydantic import ValidationError
+from typing import TYPE_CHECKING
 from log.log import Log
+from log.trace import traced
+from model.arr_instance import ArrInstance, SONARR, RADARR
 from model.torrent import Torrent
 
-class enums(Enum):
-    SONARR = "tv-sonarr"
-    RADARR = "radarr"
-
-SONARR = enums.SONARR
-RADARR = enums.RADARR
+if TYPE_CHECKING:
+    # Full models are big, only imported when ARR_FULL_VALIDATION is on
+    from api.SonarrResponse import SonarrResponse
+    from api.RadarrResponse import RadarrResponse
 
 class Arr():
-    def __init__(self, logger: Log):
+    def __init__(self, logger: Log, http: HttpClient, full_validation: bool = False):
         self.logger = logger
+        # Full pydantic models are opt-in for debugging, slim projection is much cheaper on large queues
+        self.full_validation = full_validation
         self.TIMEOUT = 30
+        # Keep-alive connection reused across pages, and across cycles in daemon mode
+        self.http = http
+        self.PAGE_SIZE = 250
+        # importPending and importBlocked are both "completed" download status in Arr queue
+        self.IMPORTABLE_STATUS = "completed"
+        # Full reads of the queue before giving up when it keeps changing between pages
+        self.QUEUE_ATTEMPTS = 3
 
-    def _get_queue(self, arr_name, endpoint, api_key) -> SonarrResponse | RadarrResponse | None:
-        response = requests.get(
-            url = f"{endpoint}/api/v3/queue?pageSize=1000",
-            headers = {'X-Api-Key': api_key},
+    @traced()
+    def _get_queue(self, arr:ArrInstance, page:int = 1) -> "QueueResponse | SonarrResponse | RadarrResponse":
+        """
+        Raises:
+            requests.HTTPError: Arr answered with anything but 200
+            ValueError: page is not JSON or does not match the queue schema. Never skipped, a partial queue would purge torrents not imported yet
+        """
+        # protocol and status are filtered by Arr, older instances ignore unknown params and we filter again client side.
+        # Sort by status keeps page boundaries stable between requests, paging never relies on the order
+        response = self.http.get(
+            url = f"{arr.endpoint}/api/v3/queue",
+            params = {
+                "page": page,
+                "pageSize": self.PAGE_SIZE,
+                "sortKey": "status",
+                "sortDirection": "ascending",
+                "protocol": "torrent",
+                "status": self.IMPORTABLE_STATUS,
+            },
+            headers = {'X-Api-Key': arr.api_key},
             timeout = self.TIMEOUT)
 
         if response.status_code == 200:
             try:
-                if arr_name == SONARR:
+                if not self.full_validation:
+                    # Parse raw bytes with pydantic-core, skip building the full dict tree with json.loads
+                    return QueueResponse.model_validate_json(response.content)
+                elif arr.kind == SONARR:
+                    from api.SonarrResponse import SonarrResponse
                     return SonarrResponse(**response.json())
-                elif arr_name == RADARR:
+                elif arr.kind == RADARR:
+                    from api.RadarrResponse import RadarrResponse
                     return RadarrResponse(**response.json())
             except requests.JSONDecodeError as e:
-                self.logger.error("Error decoding JSON response: %s", e)
-                return None
-        else:
-            raise requests.HTTPError("Failed to fetch Sonarr queue")
+                raise ValueError(f"{arr.name} queue page {page} is not valid JSON: {e}") from e
+            except ValidationError as e:
+                # pydantic-core reports invalid JSON the same way as a schema change, both mean this page cannot be trusted
+                raise ValueError(f"{arr.name} queue page {page} does not match the expected queue schema: {e}") from e
+        raise requests.HTTPError(f"Failed to fetch {arr.name} queue: HTTP {response.status_code}")
+
+    def _read_queue(self, arr:ArrInstance) -> list:
+        """
+        Every queue record, page by page instead of one capped pageSize=1000 request.
+        Always pages up to totalRecords, Arr builds without the status filter do not sort completed records first.
+        A record leaving or joining between two pages shifts the rest, one could be skipped. Callers mark whatever
+        is absent as imported and purge it, so a queue that changed while paging is read again instead
+
+        Returns:
+            list[Record]: Sonarr or Radarr queue records
 
+        Raises:
+            ValueError: a page failed to decode, or the queue still changed on the last attempt
+        """
+        for attempt in range(1, self.QUEUE_ATTEMPTS + 1):
+            records = []
+            page = 1
+            total = None
+            changed = False
+            while True:
+                queue = self._get_queue(arr, page)
+                self.logger.debug("Service: %s Page %s of %s records", arr.name, page, queue.totalRecords)
+                if total is None:
+                    total = queue.totalRecords
+                elif queue.totalRecords != total:
+                    changed = True
+                    break
+                records.extend(queue.records)
+                if len(records) >= total or len(queue.records) == 0:
+                    break
+                page += 1
+
+            # An empty page before totalRecords was reached also means records left in the meantime
+            if not changed and len(records) == total:
+                return records
+            self.logger.warning("Service: %s queue changed while paging, reading it again (attempt %s of %s)", arr.name, attempt, self.QUEUE_ATTEMPTS)
+        raise ValueError(f"{arr.name} queue kept changing while paging, not acting on an incomplete queue")
 
-    def get_api_queue(self, endpoint:str, api_key:str, arr_name: enums) -> list[Torrent]:
+    @traced()
+    def get_api_queue(self, arr: ArrInstance) -> list[Torrent]:
         """
-        This gets arr API queue. It will check if queue is torrent then parse outputPath and get path after /radarr /tv-sonarr
+        This gets arr API queue. It will check if queue is torrent then parse outputPath and get path after the instance category (/radarr /tv-sonarr)
 
         Args:
-            arr_name(enums): Arr instance ENUM only
+            arr(ArrInstance): Arr instance to query
 
         Returns:
             Set(str): Set of relative path for pending import
         """
-        if arr_name not in [SONARR, RADARR]:
-            self.logger.warning("Unsupported ARR service: %s", arr_name)
-
-        queue = None
-        if arr_name == SONARR and endpoint and api_key:
-            queue = self._get_queue(SONARR, endpoint, api_key)
-        elif arr_name == RADARR and endpoint and api_key:
-            queue = self._get_queue(RADARR, endpoint, api_key)
+        if arr.kind not in [SONARR, RADARR]:
+            self.logger.warning("Unsupported ARR service: %s", arr.kind)
+
+        if arr.kind in [SONARR, RADARR] and arr.endpoint and arr.api_key:
+            records = self._read_queue(arr)
         else:
-            self.logger.warning("Unsupported ARR service: %s endpoint URL or API key not set.", arr_name)
+            self.logger.warning("Unsupported ARR service: %s endpoint URL or API key not set.", arr.name)
             return []
-        self.logger.debug("Service: %s Return records: %s", arr_name.value, queue.records)
 
         results:list[Torrent] = []
-        for record in queue.records:
+        seen:set[str] = set()
+        for record in records:
+            self.logger.debug("Service: %s Return record: %s", arr.name, record)
             if record.protocol == "torrent" and record.trackedDownloadState in ["importPending", "importBlocked"] and record.outputPath is not None:
                 output_path = record.outputPath
 
                 # Search for arr term and strip to only relative path, can have many level depth
-                index_of = output_path.split("/").index(arr_name.value)
+                segments = output_path.split("/")
+                if arr.category not in segments:
+                    self.logger.warning("Service: %s outputPath %s is not under category %s, skipping", arr.name, output_path, arr.category)
+                    continue
+                index_of = segments.index(arr.category)
                 relative_path = "/".join(output_path.split("/")[index_of + 1:])
 
-                # Emulate a set
-                if relative_path not in [res.path for res in results]:
-                    # This is only preliminary check, will use "find ./ -type d" to further verify
+                # Keep queue order, a season pack has one record per episode with the same outputPath
+                if relative_path not in seen:
+                    seen.add(relative_path)
+                    # This is only preliminary check, resolved against the seedbox listing (PathIndex) later
                     results.append(Torrent(path = relative_path, is_dir = "/" in relative_path))
 
-        self.logger.info("Service: %s Filtered result set: %s", arr_name.value, results)
+        self.logger.info("Service: %s Filtered result set: %s", arr.name, results)
         return results
+
+    @traced()
+    def get_queue_download_ids(self, arr: ArrInstance) -> set[str]:
+        """
+        Download ids of every completed torrent still in the queue, whatever its import state.
+        A release that is gone from here is fully imported (or removed by user)
+
+        Returns:
+            Set(str): Upper case download ids
+        """
+        if arr.kind not in [SONARR, RADARR] or not arr.endpoint or not arr.api_key:
+            return set()
+        return {record.downloadId.upper() for record in self._read_queue(arr) if record.downloadId}
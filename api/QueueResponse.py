@@ -0,0 +1,24 @@
+from typing import Optional
+from pydantic import BaseModel, ConfigDict
+
+# Slim projection of Sonarr/Radarr queue page, only fields the pipeline reads.
+# Everything else in the payload is skipped, so Arr adding or changing unrelated fields will not break validation.
+# Use SonarrResponse/RadarrResponse (ARR_FULL_VALIDATION) when you need to debug the full record
+
+class Record(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    # Required: every queue record carries them, a renamed field would otherwise quietly read as "not completed"
+    status: str
+    protocol: str
+    trackedDownloadState: Optional[str] = None
+    outputPath: Optional[str] = None
+    downloadId: Optional[str] = None
+
+class QueueResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    page: int
+    pageSize: int
+    totalRecords: int
+    records: list[Record]
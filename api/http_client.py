@@ -0,0 +1,102 @@
+import time
+import random
+import requests
+from typing import Callable
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from log.log import Log
+
+# Only these are safe to send twice, a retried POST could post the same notification twice
+IDEMPOTENT_METHODS = ["GET", "HEAD", "OPTIONS", "PUT", "DELETE"]
+# Worth another try, anything else is answered the same way next time
+RETRY_STATUS = [429, 500, 502, 503, 504]
+# Upper bound for a server supplied Retry-After, a run should not sleep for minutes on one request
+RETRY_AFTER_MAX = 60
+
+# method, url, status code (None when no response came back), seconds
+Hook = Callable[[str, str, int | None, float], None]
+
+class HttpClient:
+    """
+        One pooled requests session for every Arr and notification call.
+        Connections are kept alive per host and reused across pages, pipelines and daemon cycles.
+        Idempotent requests are retried on connection errors and transient status codes with jittered exponential backoff.
+        Every attempt is reported to hooks with its duration, e.g. for per run metrics
+    """
+    def __init__(self, logger:Log, timeout:int = 30, retries:int = 3, backoff:float = 0.5, backoff_max:float = 10, pool_size:int = 10) -> None:
+        self.logger = logger
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hooks:list[Hook] = []
+
+        self.session = requests.Session()
+        # Retries are handled here so each attempt is timed and logged, the adapter only pools
+        adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size, max_retries = 0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # requests decodes these transparently, a large Arr queue page shrinks a lot
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+
+    def get(self, url:str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url:str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method:str, url:str, **kwargs) -> requests.Response:
+        """
+        Send one request, retried when idempotent. The last response is returned whatever its status, callers decide what an error is
+
+        Raises:
+            requests.RequestException: no response after the last attempt
+        """
+        method = method.upper()
+        attempts = 1 + (self.retries if method in IDEMPOTENT_METHODS else 0)
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).netloc
+
+        for attempt in range(1, attempts + 1):
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._report(method, url, None, time.monotonic() - start)
+                if attempt == attempts:
+                    raise
+                delay = self._delay(attempt, None)
+                self.logger.warning("%s %s failed (%s), retry %s of %s in %.1fs", method, host, type(e).__name__, attempt, attempts - 1, delay)
+                time.sleep(delay)
+                continue
+
+            elapsed = time.monotonic() - start
+            self._report(method, url, response.status_code, elapsed)
+            self.logger.debug("%s %s %s in %.3fs", method, host, response.status_code, elapsed)
+            if response.status_code not in RETRY_STATUS or attempt == attempts:
+                return response
+
+            delay = self._delay(attempt, response.headers.get("Retry-After"))
+            self.logger.warning("%s %s returned %s, retry %s of %s in %.1fs", method, host, response.status_code, attempt, attempts - 1, delay)
+            # Give the connection back to the pool before sleeping
+            response.close()
+            time.sleep(delay)
+
+        raise requests.RequestException(f"{method} {host} gave up after {attempts} attempts")
+
+    def _delay(self, attempt:int, retry_after:str | None) -> float:
+        """ Full jitter so pipelines retrying the same Arr do not hit it in lockstep, server Retry-After (seconds) is a floor """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1)))
+        if retry_after is not None and retry_after.strip().isdigit():
+            delay = max(delay, min(float(retry_after), RETRY_AFTER_MAX))
+        return delay
+
+    def _report(self, method:str, url:str, status:int | None, seconds:float) -> None:
+        for hook in list(self.hooks):
+            try:
+                hook(method, url, status, seconds)
+            except Exception as e:
+                self.logger.error("HTTP timing hook failed: %s", e)
+
+    def close(self) -> None:
+        self.session.close()
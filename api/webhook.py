@@ -0,0 +1,149 @@
+import json
+import base64
+import hmac
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from urllib.parse import urlparse, parse_qs
+from log.log import Log
+from model.arr_instance import ArrInstance
+from model.path_index import PathIndex
+
+class WebhookEvent:
+    def __init__(self, arr_name: str, event_type: str, download_id: str, paths: list[str]):
+        # ArrInstance.name the webhook was posted for
+        self.arr_name = arr_name
+        self.event_type = event_type
+        self.download_id = download_id
+        # Imported source paths relative to the category folder, not torrent roots yet (see torrent_names)
+        self.paths = paths
+
+    def torrent_names(self, arr: ArrInstance, index: PathIndex, sublisting: Callable[[str], dict]) -> list[str]:
+        """
+        Torrent roots the imported files belong to (PathIndex.root_of with the category anchor).
+        A directory that got listed as well (category subfolder, see SSH.filter_seedbox_against_api) holds more than this release,
+        its listing is added and the files resolved again below it
+
+        Args:
+            index(PathIndex): seedbox listing of arr, paths not found in it are left out
+            sublisting(Callable): listed entries of a directory relative to the seedbox path, {} if it was never listed
+        """
+        expanded:set[str] = set()
+        while True:
+            roots = [index.root_of(path, arr.category) for path in self.paths]
+            folders = {root for root in roots if root is not None and index.is_dir(root) and root not in expanded}
+            children = {folder: sublisting(folder) for folder in folders}
+            if not any(children.values()):
+                return list(dict.fromkeys(root for root in roots if root is not None))
+            for (folder, entries) in children.items():
+                expanded.add(folder)
+                if len(entries) > 0:
+                    index.add_entries(entries, folder)
+
+def _relative_path(path: str, arr: ArrInstance) -> str:
+    # Same cut as Arr.get_api_queue, everything after the first instance category (/tv-sonarr, /radarr) segment
+    segments = path.split("/")
+    if arr.category not in segments:
+        return ""
+    return "/".join(segments[segments.index(arr.category) + 1:])
+
+def parse_event(arr: ArrInstance, payload: dict) -> WebhookEvent:
+    """
+    Pull event type, download id and imported paths out of a Sonarr/Radarr webhook payload.
+    Import (Download) payload carry the seedbox side path in episodeFile(s)/movieFile sourcePath
+    """
+    source_paths = []
+    for key in ["episodeFile", "movieFile"]:
+        if isinstance(payload.get(key), dict):
+            source_paths.append(payload[key].get("sourcePath") or "")
+    for episode_file in payload.get("episodeFiles") or []:
+        source_paths.append(episode_file.get("sourcePath") or "")
+
+    paths = list(dict.fromkeys(path for path in (_relative_path(path, arr) for path in source_paths) if path))
+    return WebhookEvent(arr_name = arr.name,
+                        event_type = payload.get("eventType", ""),
+                        download_id = (payload.get("downloadId") or "").upper(),
+                        paths = paths)
+
+class WebhookServer:
+    """
+        Embedded HTTP listener for Arr webhooks. Handler only parse and hand off the event,
+        actual sync/purge happens on the daemon thread so it never races a polling cycle.
+    """
+    def __init__(self, logger: Log, listen: str, token: str, routes: dict[str, ArrInstance], on_event: Callable[[WebhookEvent], None]) -> None:
+        """
+        Args:
+            routes(dict[str, ArrInstance]): POST /webhook/<route> in Arr Settings -> Connect -> Webhook, route to the instance it belongs to
+        """
+        self.logger = logger
+        self.routes = routes
+        (host, _, port) = listen.rpartition(":")
+        # A bare port stays on loopback, listening on every interface has to be asked for ("0.0.0.0:8765")
+        self.address = (host if host else "127.0.0.1", int(port))
+        self.token = token
+        self.on_event = on_event
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    def _authorized(self, handler: BaseHTTPRequestHandler) -> bool:
+        # Import events purge local files, an unauthenticated listener is never accepted
+        if not self.token:
+            return False
+        # Arr webhook support basic auth (password) or we accept ?token= in URL
+        supplied = parse_qs(urlparse(handler.path).query).get("token", [""])[0]
+        auth = handler.headers.get("Authorization", "")
+        if not supplied and auth.startswith("Basic "):
+            try:
+                supplied = base64.b64decode(auth[6:]).decode().partition(":")[2]
+            except (ValueError, UnicodeDecodeError):
+                supplied = ""
+        return hmac.compare_digest(supplied, self.token)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                route = urlparse(self.path).path.rstrip("/").split("/")[-1]
+                if route not in server.routes:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                if not server._authorized(self):
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+
+                try:
+                    length = int(self.headers.get("Content-Length", "0"))
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    event = parse_event(server.routes[route], payload)
+                except (ValueError, AttributeError) as e:
+                    server.logger.error("Invalid webhook payload: %s", e)
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+
+                server.logger.info("Webhook %s %s download %s paths %s", route, event.event_type, event.download_id, event.paths)
+                if event.event_type != "Test":
+                    server.on_event(event)
+                # Accepted, work happens asynchronously
+                self.send_response(202)
+                self.end_headers()
+
+            def log_message(self, format, *args) -> None:
+                server.logger.debug("Webhook %s - %s", self.address_string(), format % args)
+
+        return Handler
+
+    def start(self) -> None:
+        self._server = ThreadingHTTPServer(self.address, self._make_handler())
+        self._thread = threading.Thread(target = self._server.serve_forever, name = "webhook", daemon = True)
+        self._thread.start()
+        self.logger.info("Webhook listener on %s:%s", *self.address)
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,82 @@
+"""
+Stand-in Sonarr/Radarr for the benchmark harness: an in-process HTTP server answering /<instance>/api/v3/queue
+with synthetic completed torrent records, paged like Arr v3
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# outputPath prefix as a seedbox download client would report it, the category segment follows
+OUTPUT_ROOT = "/home/bench/downloads/torrent"
+
+def synthetic_records(category:str, names:list[str]) -> list[dict]:
+    """ One completed, importPending torrent record per name, only fields a real queue record carries """
+    records = []
+    for (idx, name) in enumerate(names):
+        records.append({
+            "id": idx,
+            "title": name,
+            "size": 8192,
+            "sizeleft": 0,
+            "status": "completed",
+            "trackedDownloadStatus": "ok",
+            "trackedDownloadState": "importPending",
+            "statusMessages": [],
+            "downloadId": f"{category}-{idx}".encode().hex().upper(),
+            "protocol": "torrent",
+            "downloadClient": "qBittorrent",
+            "outputPath": f"{OUTPUT_ROOT}/{category}/{name}",
+        })
+    return records
+
+class FakeArr:
+    """ Queue per instance name, swapped between benchmark scenarios with set_queue """
+    def __init__(self) -> None:
+        self._queues:dict[str, list[dict]] = {}
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                (instance, _, route) = url.path.strip("/").partition("/")
+                if route != "api/v3/queue" or instance not in fake._queues:
+                    self.send_error(404)
+                    return
+                query = parse_qs(url.query)
+                page = int(query.get("page", ["1"])[0])
+                page_size = int(query.get("pageSize", ["10"])[0])
+                records = fake._queues[instance]
+
+                body = json.dumps({
+                    "page": page,
+                    "pageSize": page_size,
+                    "sortKey": "status",
+                    "sortDirection": "ascending",
+                    "totalRecords": len(records),
+                    "records": records[(page - 1) * page_size:page * page_size],
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port:int = self._server.server_address[1]
+
+    def endpoint(self, instance:str) -> str:
+        return f"http://127.0.0.1:{self.port}/{instance}"
+
+    def set_queue(self, instance:str, records:list[dict]) -> None:
+        self._queues[instance] = records
+
+    def start(self) -> None:
+        threading.Thread(target = self._server.serve_forever, daemon = True).start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
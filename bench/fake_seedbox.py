@@ -0,0 +1,132 @@
+"""
+Stand-in seedbox for the benchmark harness: a paramiko SSH server on localhost that runs every exec request
+as a local shell command, next to a generated torrent tree.
+Pipeline commands (find, du) and rsync --server both run against the local tree, so the whole transport is exercised
+"""
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import paramiko
+
+# Bytes per generated file, keeps 10k torrents small on disk while every file still goes through rsync
+FILE_SIZE = 4096
+
+class _Session(paramiko.ServerInterface):
+    """ Accept any user without credentials and run whatever it asks for """
+    def get_allowed_auths(self, username:str) -> str:
+        return "none,publickey,password"
+
+    def check_auth_none(self, username:str) -> int:
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_publickey(self, username:str, key:paramiko.PKey) -> int:
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username:str, password:str) -> int:
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind:str, chanid:int) -> int:
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel:paramiko.Channel, command:bytes) -> bool:
+        threading.Thread(target = _run, args = (channel, command.decode()), daemon = True).start()
+        return True
+
+def _run(channel:paramiko.Channel, command:str) -> None:
+    process = subprocess.Popen(["sh", "-c", command], stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+
+    def feed_stdin() -> None:
+        # rsync --server reads the file list and checksums from the client, plain commands get EOF right away
+        try:
+            while True:
+                data = channel.recv(65536)
+                if not data:
+                    break
+                process.stdin.write(data)
+                process.stdin.flush()
+        except (OSError, EOFError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    def drain(stream, send) -> None:
+        while True:
+            data = os.read(stream.fileno(), 65536)
+            if not data:
+                return
+            send(data)
+
+    threading.Thread(target = feed_stdin, daemon = True).start()
+    stderr = threading.Thread(target = drain, args = (process.stderr, channel.sendall_stderr), daemon = True)
+    stderr.start()
+    try:
+        drain(process.stdout, channel.sendall)
+        stderr.join()
+        channel.send_exit_status(process.wait())
+    except OSError:
+        process.kill()
+    finally:
+        channel.close()
+
+class FakeSeedbox:
+    """
+        Localhost SSH endpoint serving root.
+        Every connection gets its own paramiko transport thread, OpenSSH ControlMaster multiplexes rsync channels over one of them
+    """
+    def __init__(self, root:str) -> None:
+        self.root = root
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(64)
+        self.port:int = self._sock.getsockname()[1]
+        self._transports:list[paramiko.Transport] = []
+        self._closed = False
+
+    def start(self) -> None:
+        threading.Thread(target = self._accept, daemon = True).start()
+
+    def _accept(self) -> None:
+        while not self._closed:
+            try:
+                (client, _) = self._sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server = _Session())
+            self._transports.append(transport)
+
+    def close(self) -> None:
+        self._closed = True
+        self._sock.close()
+        for transport in self._transports:
+            transport.close()
+
+    def generate(self, category:str, names:list[str]) -> str:
+        """
+        Fresh torrent tree under root/category, a name ending in .mkv is a single file torrent, anything else a directory of two episodes
+
+        Returns:
+            str: the category directory, what SEEDBOX_*_TORRENT_PATH points at
+        """
+        path = os.path.join(self.root, category)
+        shutil.rmtree(path, ignore_errors = True)
+        os.makedirs(path)
+        payload = os.urandom(FILE_SIZE)
+        for name in names:
+            if name.endswith(".mkv"):
+                files = [os.path.join(path, name)]
+            else:
+                os.makedirs(os.path.join(path, name))
+                files = [os.path.join(path, name, f"{name}.E{episode:02d}.mkv") for episode in (1, 2)]
+            for file_path in files:
+                with open(file_path, "wb") as file:
+                    file.write(payload)
+        return path
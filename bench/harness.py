@@ -0,0 +1,269 @@
+"""
+End to end benchmark of main.main against local stand-ins, no Sonarr, Radarr or seedbox needed.
+Fake Arr queue server, paramiko SSH server on localhost over a generated torrent tree, rsync into a local directory.
+Every scenario is a fresh interpreter like a timer run, stage timings come from the METRICS_TEXTFILE it writes.
+
+Scenarios per queue size, in order on the same state:
+    transfer  new torrents listed, enqueued and handed to detached rsync, then waited for
+    reap      detached transfers reaped, verified against the seedbox manifest, permissions fixed
+    steady    same queue again, nothing new, cached listing and reconcile only
+    drain     queue emptied, everything marked complete and purged
+    idle      queue still empty, the fast path that stops after the Arr queue check
+
+Usage:
+    python -m bench.harness [--sizes 10,1000,10000] [--update] [--keep]
+"""
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import argparse
+import tempfile
+import subprocess
+import paramiko
+from bench.fake_arr import FakeArr, synthetic_records
+from bench.fake_seedbox import FakeSeedbox
+from metrics.metrics import PREFIX
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "bench", "baseline.json")
+SCENARIOS = ["transfer", "reap", "steady", "drain", "idle"]
+# A timing only counts as a regression when it is this much slower than baseline and by more than SLACK seconds
+RATIO = 1.5
+SLACK = 0.05
+# Longest wait for detached rsync of one transfer scenario
+TRANSFER_TIMEOUT = 1800
+# Timings that mostly measure rsync itself, only compared against a baseline recorded with the same rsync build
+RSYNC_BOUND = [("transfer", "rsync_detached")]
+# Instance: (seedbox category, torrent name pattern), legacy single Sonarr/Radarr setup so categories are the default ones
+INSTANCES = {
+    "sonarr": ("tv-sonarr", "Bench.Show.{idx:05d}.S01.1080p.WEB-BENCH"),
+    "radarr": ("radarr", "Bench.Movie.{idx:05d}.2020.1080p.BluRay-BENCH.mkv"),
+}
+
+class Harness:
+    """ Stand-ins and scratch directories for one queue size """
+    def __init__(self, size:int, workdir:str) -> None:
+        self.size = size
+        self.workdir = workdir
+        self.arr = FakeArr()
+        self.seedbox = FakeSeedbox(os.path.join(workdir, "seedbox"))
+        self.names:dict[str, list[str]] = {}
+        self.env = self._environment()
+
+    def _environment(self) -> dict[str, str]:
+        home = os.path.join(self.workdir, "home")
+        bin_dir = os.path.join(self.workdir, "bin")
+        os.makedirs(os.path.join(home, ".ssh"))
+        os.makedirs(bin_dir)
+
+        # paramiko (listing) authenticates with a key from $HOME, the fake server accepts any
+        paramiko.RSAKey.generate(2048).write_private_key_file(os.path.join(home, ".ssh", "id_rsa"))
+        # OpenSSH (rsync -e) reads ~/.ssh of the real user, wrap it so it never touches known_hosts or user config
+        ssh_config = os.path.join(self.workdir, "ssh_config")
+        with open(ssh_config, "w", encoding = "utf-8") as file:
+            file.write("Host *\n  StrictHostKeyChecking no\n  UserKnownHostsFile /dev/null\n  LogLevel ERROR\n  BatchMode yes\n")
+        with open(os.path.join(bin_dir, "ssh"), "w", encoding = "utf-8") as file:
+            file.write(f"#!/bin/sh\nexec {shutil.which('ssh')} -F {ssh_config} \"$@\"\n")
+        os.chmod(os.path.join(bin_dir, "ssh"), 0o755)
+
+        env = dict(os.environ)
+        env.pop("SSH_AUTH_SOCK", None)
+        env.update({
+            "HOME": home,
+            "PATH": f"{bin_dir}{os.pathsep}{env.get('PATH', '')}",
+            "SEEDBOX_ENDPOINT": "127.0.0.1",
+            "SEEDBOX_PORT": str(self.seedbox.port),
+            "SEEDBOX_USERNAME": "bench",
+            "SEEDBOX_CONTROL_PATH": os.path.join(self.workdir, "cm-%C"),
+            "DB_PATH": os.path.join(self.workdir, "database.db"),
+            "LOCK_DIR": os.path.join(self.workdir, "locks"),
+            "TRANSFER_LOG_DIR": os.path.join(self.workdir, "transfers"),
+            "METRICS_TEXTFILE": os.path.join(self.workdir, "metrics.prom"),
+            "CHMOD": "755",
+            "VERBOSE": "error",
+            # Values from a local .env must not leak in, load_dotenv never overrides what is already set
+            "ARR_INSTANCES": "",
+            "NOTIFICATION_SERVICE": "",
+            "WEBHOOK_URL": "",
+            "TRACE": "",
+            "PROFILE": "",
+            "DEV": "",
+            "RSYNC_APPLY_PERMISSION": "",
+            "CHOWN_UID": "",
+            "CHOWN_GID": "",
+        })
+        for (instance, (category, _)) in INSTANCES.items():
+            prefix = instance.upper()
+            dest_dir = os.path.join(self.workdir, "local", category)
+            os.makedirs(dest_dir)
+            env.update({
+                f"{prefix}_ENDPOINT": self.arr.endpoint(instance),
+                f"{prefix}_API_KEY": "bench",
+                f"{prefix}_DEST_DIR": dest_dir,
+                f"SEEDBOX_{prefix}_TORRENT_PATH": os.path.join(self.seedbox.root, category),
+            })
+        return env
+
+    def start(self) -> None:
+        # Queue size is split across both instances, Sonarr gets the odd one
+        counts = {"sonarr": self.size - self.size // 2, "radarr": self.size // 2}
+        for (instance, (category, pattern)) in INSTANCES.items():
+            self.names[instance] = [pattern.format(idx = idx) for idx in range(counts[instance])]
+            self.seedbox.generate(category, self.names[instance])
+        self.arr.start()
+        self.seedbox.start()
+
+    def close(self) -> None:
+        # Control master outlives the run by ControlPersist, stop it before its server goes away
+        subprocess.run(["ssh", "-p", str(self.seedbox.port), "-o", f"ControlPath={self.env['SEEDBOX_CONTROL_PATH']}", "-O", "exit", "bench@127.0.0.1"],
+                       env = self.env, capture_output = True, timeout = 10)
+        self.arr.close()
+        self.seedbox.close()
+
+    def set_queue(self, full:bool) -> None:
+        for (instance, (category, _)) in INSTANCES.items():
+            self.arr.set_queue(instance, synthetic_records(category, self.names[instance]) if full else [])
+
+    def run(self, scenario:str) -> dict[str, float]:
+        """
+        One main.main run in a fresh interpreter
+
+        Returns:
+            dict(str, float): seconds per stage summed over instances, plus run (inside main) and process (interpreter start to exit)
+        """
+        self.set_queue(scenario in ["transfer", "reap", "steady"])
+        if os.path.exists(self.env["METRICS_TEXTFILE"]):
+            os.remove(self.env["METRICS_TEXTFILE"])
+
+        start = time.monotonic()
+        result = subprocess.run([sys.executable, "-c", "import config, main\nfrom log.log import Log\nmain.main(Log(config.VERBOSE))"],
+                                cwd = ROOT, env = self.env, capture_output = True, text = True)
+        process = time.monotonic() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"{scenario} run exited with {result.returncode}:\n{result.stderr[-4000:]}")
+
+        metrics = read_metrics(self.env["METRICS_TEXTFILE"])
+        timings = {stage: seconds for (stage, seconds) in metrics.get("stage_duration_seconds", {}).items()}
+        timings["run"] = metrics["run_duration_seconds"][""]
+        timings["process"] = process
+
+        if scenario == "transfer":
+            timings["rsync_detached"] = self.wait_detached(int(metrics.get("items_detached", {}).get("", 0)))
+        if scenario == "reap":
+            failed = int(metrics.get("items_failed", {}).get("", 0))
+            if failed > 0:
+                print(f"  warning: {failed} transfers failed, see {self.env['TRANSFER_LOG_DIR']}", file = sys.stderr)
+        return timings
+
+    def wait_detached(self, expected:int) -> float:
+        """ Block until every detached rsync wrote its exit status, returns how long that took """
+        start = time.monotonic()
+        pattern = os.path.join(self.env["TRANSFER_LOG_DIR"], "*.status")
+        while len(glob.glob(pattern)) < expected:
+            if time.monotonic() - start > TRANSFER_TIMEOUT:
+                raise RuntimeError(f"Detached rsync did not finish within {TRANSFER_TIMEOUT}s, {len(glob.glob(pattern))} of {expected} done")
+            time.sleep(0.2)
+        return time.monotonic() - start
+
+def read_metrics(path:str) -> dict[str, dict[str, float]]:
+    """
+    Returns:
+        dict(str, dict(str, float)): metric name (without prefix) -> stage label, or "" when it has none -> value summed over every other label
+    """
+    values:dict[str, dict[str, float]] = {}
+    with open(path, encoding = "utf-8") as file:
+        for line in file:
+            if line.startswith("#") or not line.strip():
+                continue
+            (series, value) = line.rsplit(" ", 1)
+            (name, _, labels) = series.partition("{")
+            name = name.removeprefix(f"{PREFIX}_")
+            stage = next((label.split("=", 1)[1].strip('"') for label in labels.rstrip("}").split(",") if label.startswith("stage=")), "")
+            values.setdefault(name, {})
+            values[name][stage] = values[name].get(stage, 0.0) + float(value)
+    return values
+
+def rsync_version() -> str:
+    """ First line of rsync --version, stored with each baseline so a different rsync build is not taken for a regression """
+    result = subprocess.run(["rsync", "--version"], capture_output = True, text = True)
+    return result.stdout.splitlines()[0].strip() if result.returncode == 0 and result.stdout else "unknown"
+
+def compare(results:dict, baseline:dict, rsync:str) -> list[str]:
+    """ Print every timing next to its baseline, returns the ones that regressed """
+    regressions = []
+    for (size, scenarios) in results.items():
+        print(f"\n{size} queue items")
+        print(f"  {'scenario':10} {'stage':16} {'seconds':>9} {'baseline':>9} {'change':>8}")
+        same_rsync = baseline.get(size, {}).get("rsync") == rsync
+        for (scenario, timings) in scenarios.items():
+            for (stage, seconds) in timings.items():
+                base = baseline.get(size, {}).get(scenario, {}).get(stage)
+                if base is None or (not same_rsync and (scenario, stage) in RSYNC_BOUND):
+                    note = "" if base is None else "  baseline from another rsync"
+                    print(f"  {scenario:10} {stage:16} {seconds:9.3f} {'-':>9} {'-':>8}{note}")
+                    continue
+                change = f"{(seconds - base) / base * 100:+7.0f}%" if base > 0 else "-"
+                regressed = seconds > base * RATIO and seconds - base > SLACK
+                print(f"  {scenario:10} {stage:16} {seconds:9.3f} {base:9.3f} {change:>8}{'  REGRESSION' if regressed else ''}")
+                if regressed:
+                    regressions.append(f"{size} {scenario} {stage}: {seconds:.3f}s vs {base:.3f}s")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "Time every pipeline stage against a fake Arr and seedbox.")
+    parser.add_argument("--sizes", default = "10,1000,10000", help = "Comma separated queue sizes")
+    parser.add_argument("--update", action = "store_true", help = f"Write these timings as the new baseline ({os.path.relpath(BASELINE_PATH, ROOT)})")
+    parser.add_argument("--keep", action = "store_true", help = "Keep scratch directories for inspection")
+    args = parser.parse_args()
+
+    for tool in ["ssh", "rsync"]:
+        if shutil.which(tool) is None:
+            sys.exit(f"{tool} is required on PATH to run the benchmark.")
+
+    rsync = rsync_version()
+    results:dict[str, dict[str, dict[str, float]]] = {}
+    for size in [int(size) for size in args.sizes.split(",") if size.strip()]:
+        workdir = tempfile.mkdtemp(prefix = f"rsync-seedbox-bench-{size}-")
+        harness = Harness(size, workdir)
+        harness.start()
+        try:
+            results[str(size)] = {}
+            for scenario in SCENARIOS:
+                print(f"{size} items: {scenario}", file = sys.stderr)
+                results[str(size)][scenario] = harness.run(scenario)
+        finally:
+            harness.close()
+            if args.keep:
+                print(f"Scratch directory kept at {workdir}", file = sys.stderr)
+            else:
+                shutil.rmtree(workdir, ignore_errors = True)
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding = "utf-8") as file:
+            baseline = json.load(file)
+    regressions = compare(results, baseline, rsync)
+    missing = [size for size in results if size not in baseline]
+
+    if args.update:
+        # Sizes not run this time keep their old baseline
+        for (size, scenarios) in results.items():
+            baseline[size] = dict(scenarios, rsync = rsync)
+        with open(BASELINE_PATH, "w", encoding = "utf-8") as file:
+            json.dump(baseline, file, indent = 2, sort_keys = True)
+            file.write("\n")
+        print(f"\nBaseline written to {BASELINE_PATH}")
+    elif len(regressions) > 0:
+        print(f"\n{len(regressions)} timings regressed more than {RATIO}x:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    elif len(missing) > 0:
+        # Nothing to compare against is not a pass
+        sys.exit(f"\nNo baseline for {', '.join(missing)} queue items, record one with --update.")
+
+if __name__ == "__main__":
+    main()
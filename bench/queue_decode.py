@@ -0,0 +1,69 @@
+"""
+Micro-benchmark of Arr queue decoding, full pydantic models vs slim projection
+
+Usage:
+    python -m bench.queue_decode [records] [rounds]
+"""
+import json
+import sys
+import timeit
+from api.SonarrResponse import SonarrResponse
+from api.QueueResponse import QueueResponse
+
+def synthetic_queue(size:int) -> bytes:
+    records = []
+    for idx in range(size):
+        records.append({
+            "seriesId": idx,
+            "episodeId": idx,
+            "seasonNumber": 1,
+            "languages": [{"id": 1, "name": "English"}],
+            "quality": {
+                "quality": {"id": 7, "name": "Bluray-1080p", "source": "bluray", "resolution": 1080},
+                "revision": {"version": 1, "real": 0, "isRepack": False}
+            },
+            "customFormats": [],
+            "customFormatScore": 0,
+            "size": 1073741824,
+            "title": f"Show.S01E{idx:05d}.1080p.BluRay.x264-GROUP",
+            "estimatedCompletionTime": "2025-01-01T00:00:00Z",
+            "added": "2025-01-01T00:00:00Z",
+            "status": "completed",
+            "trackedDownloadStatus": "ok",
+            "trackedDownloadState": "importPending",
+            "statusMessages": [{"title": "Show.S01", "messages": ["One or more episodes expected in this release were not imported"]}],
+            "errorMessage": None,
+            "downloadId": f"{idx:040x}",
+            "protocol": "torrent",
+            "downloadClient": "qBittorrent",
+            "downloadClientHasPostImportCategory": False,
+            "indexer": "Indexer",
+            "outputPath": f"/home/seedboxuser/storage/downloads/torrent/tv-sonarr/Show.S01E{idx:05d}.1080p.BluRay.x264-GROUP",
+            "episodeHasFile": False,
+            "sizeleft": 0,
+            "timeleft": "00:00:00",
+            "id": idx
+        })
+    return json.dumps({
+        "page": 1,
+        "pageSize": size,
+        "sortKey": "status",
+        "sortDirection": "ascending",
+        "totalRecords": size,
+        "records": records
+    }).encode()
+
+def main(size:int = 10000, rounds:int = 5) -> None:
+    payload = synthetic_queue(size)
+    print(f"Payload: {size} records, {len(payload) / 1024 / 1024:.1f} MiB")
+
+    # Full path is what Arr._get_queue did before, json.loads then validate every nested model
+    full = min(timeit.repeat(lambda: SonarrResponse(**json.loads(payload)), number=1, repeat=rounds))
+    slim = min(timeit.repeat(lambda: QueueResponse.model_validate_json(payload), number=1, repeat=rounds))
+
+    print(f"Full SonarrResponse:   {full * 1000:8.1f} ms")
+    print(f"Slim QueueResponse:    {slim * 1000:8.1f} ms")
+    print(f"Speedup:               {full / slim:8.1f}x")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
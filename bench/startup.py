@@ -0,0 +1,47 @@
+"""
+Startup benchmark, what `import main` costs before a run makes its first Arr request
+
+Usage:
+    python -m bench.startup [rounds] [top]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+# Only the Arr queue check should need these on an idle run, anything else showing up here is an eager import
+HEAVY_MODULES = ["paramiko", "cryptography", "sqlalchemy", "psutil", "pydantic", "requests"]
+
+def import_times() -> dict[str, int]:
+    """
+    Returns:
+        dict(str, int): cumulative import time in microseconds per module, from a fresh interpreter
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd = root, capture_output = True, text = True, check = True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        (_, cumulative, name) = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+def main(rounds:int = 5, top:int = 15) -> None:
+    runs = [import_times() for _ in range(rounds)]
+    totals = [run["main"] for run in runs]
+    print(f"import main: median {statistics.median(totals) / 1000:8.1f} ms, min {min(totals) / 1000:8.1f} ms over {rounds} rounds")
+
+    # Cumulative, a nested module is also counted in every module that imported it
+    last = runs[-1]
+    print("\nSlowest of the last round:")
+    for (name, cumulative) in sorted(((name, cumulative) for (name, cumulative) in last.items() if name != "main"), key = lambda item: item[1], reverse = True)[:top]:
+        print(f"  {name:40} {cumulative / 1000:8.1f} ms")
+
+    loaded = [module for module in HEAVY_MODULES if module in last]
+    print(f"\nHeavy modules loaded: {', '.join(loaded) if len(loaded) > 0 else 'none'}")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,66 @@
+import os
+import fcntl
+import hashlib
+
+class FileLock:
+    """
+        flock based lock, released by the kernel when the holder dies so a crashed run never leaves it stuck.
+        Lock follows the open file description, a child started with pass_fds keeps holding it after we close ours
+    """
+    def __init__(self, path:str) -> None:
+        self.path = path
+        self.fd: int | None = None
+
+    def acquire(self, blocking:bool = False) -> bool:
+        os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self) -> None:
+        if self.fd is not None:
+            # Closing our fd drops the lock unless a child inherited it
+            os.close(self.fd)
+            self.fd = None
+
+    def is_held_elsewhere(self) -> bool:
+        """ Probe without keeping the lock """
+        if self.fd is not None:
+            return False
+        if not self.acquire():
+            return True
+        self.release()
+        return False
+
+    def __enter__(self) -> "FileLock":
+        self.acquire(blocking = True)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
+
+def arr_lock(lock_dir:str, arr_value:str) -> FileLock:
+    """ Held while one run reconciles an Arr's DB rows """
+    return FileLock(os.path.join(lock_dir, f"arr-{arr_value}.lock"))
+
+def purge_lock(lock_dir:str, arr_value:str) -> FileLock:
+    """ Held from purge submit until purged rows are flagged """
+    return FileLock(os.path.join(lock_dir, f"purge-{arr_value}.lock"))
+
+def transfer_lock(lock_dir:str, arr_value:str, torrent_name:str) -> FileLock:
+    """ Held for as long as a torrent is in flight, by us or by a detached rsync """
+    digest = hashlib.sha1(torrent_name.encode()).hexdigest()[:16]
+    return FileLock(os.path.join(lock_dir, f"transfer-{arr_value}-{digest}.lock"))
+
+def idle_marker(lock_dir:str, arr_value:str) -> str:
+    """ Path of the file saying the last full run of an Arr left nothing behind, only written and removed under arr_lock """
+    return os.path.join(lock_dir, f"idle-{arr_value}")
+
+def outbox_lock(lock_dir:str) -> FileLock:
+    """ Held while one run delivers the notification outbox, shared by every Arr """
+    return FileLock(os.path.join(lock_dir, "outbox.lock"))
@@ -0,0 +1,77 @@
+import os
+from cli.rsync import PARTIAL_DIR
+from log.log import Log
+from log.trace import traced
+from model.torrent import Torrent
+
+class Manifest:
+    """
+        Compare what landed locally against the seedbox before a torrent counts as transferred.
+        Exit code 0 alone does not prove every file arrived in full (torrent still being written remotely, a file replaced mid run),
+        a torrent only counts as transferred when every remote file exists locally with the same size.
+    """
+    def __init__(self, logger:Log) -> None:
+        self.logger = logger
+
+    def local(self, dest_dir:str, name:str) -> dict[str, int]:
+        """
+        Returns:
+            dict(str, int): path relative to name ("" for a single file torrent) -> size of every finished local file
+        """
+        root = os.path.join(dest_dir, name)
+        if os.path.isfile(root):
+            return {"": os.path.getsize(root)}
+
+        files:dict[str, int] = {}
+        for (dirpath, dirnames, filenames) in os.walk(root):
+            # Incomplete files wait in rsync's partial dir, they are not part of the torrent yet
+            dirnames[:] = [dirname for dirname in dirnames if dirname != PARTIAL_DIR]
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                if not os.path.islink(full_path):
+                    files[os.path.relpath(full_path, root)] = os.path.getsize(full_path)
+        return files
+
+    def local_bytes(self, dest_dir:str, name:str) -> int:
+        """ Every byte on disk for name, partial files included. Grows with every attempt that made progress """
+        root = os.path.join(dest_dir, name)
+        if not os.path.isdir(root):
+            # Single file torrent, its partial sits in the partial dir next to it
+            partial = os.path.join(dest_dir, PARTIAL_DIR, name)
+            return sum(os.path.getsize(path) for path in [root, partial] if os.path.isfile(path))
+
+        total = 0
+        for (dirpath, _, filenames) in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                if not os.path.islink(full_path):
+                    total += os.path.getsize(full_path)
+        return total
+
+    @traced()
+    def verify(self, remote:dict[str, dict[str, int]], dest_dir:str, torrents:list[Torrent], gone:set[str]) -> None:
+        """
+        Downgrade transferred torrents whose local files do not match the remote manifest, and measure local_bytes of every torrent that is not transferred.
+
+        Args:
+            remote(dict[str, dict[str, int]]): SSH.get_manifest of the transferred torrents
+            gone(set[str]): torrents without a manifest that the seedbox listing confirmed removed (SSH.get_gone)
+        """
+        for torrent in torrents:
+            if torrent.transferred:
+                remote_files = remote.get(torrent.path)
+                if remote_files is None:
+                    # Gone from the seedbox since (Arr removed it after import), nothing left to compare against
+                    if torrent.path in gone:
+                        continue
+                    # Still there but find failed on it, an unchecked transfer is not taken as done. Next run transfers again and checks
+                    torrent.transfer_error = "no remote manifest, transfer could not be verified"
+                else:
+                    local_files = self.local(dest_dir, torrent.path)
+                    mismatched = [file_path for (file_path, size) in remote_files.items() if local_files.get(file_path) != size]
+                    if len(mismatched) == 0:
+                        continue
+                    torrent.transfer_error = f"{len(mismatched)} of {len(remote_files)} files missing or incomplete locally, e.g. {os.path.join(torrent.path, mismatched[0])}"
+                torrent.transferred = False
+                self.logger.error("Manifest check failed for %s: %s", torrent.path, torrent.transfer_error)
+            torrent.local_bytes = self.local_bytes(dest_dir, torrent.path)
@@ -1,8 +1,10 @@
 import os
 import requests
+from api.http_client import HttpClient
 # from enums.enum import NOTIFICATION_ENUM
 from enum import Enum
 from log.log import Log
+from log.trace import traced
 
 class NOTIFICATION(Enum):
     DISCORD = "discord"
@@ -11,20 +13,29 @@ class NOTIFICATION(Enum):
 DISCORD = NOTIFICATION.DISCORD
 APPRISE = NOTIFICATION.APPRISE
 
+# Discord rejects an embed description over 4096 characters, longer notifications are split before sending
+MESSAGE_LIMIT = 4096
+
 class Notification:
     """
         Notification is optional, dont need to show in log if not defined
     """
-    def __init__(self, logger: Log, webhook_url: str, service: NOTIFICATION) -> None:
+    def __init__(self, logger: Log, webhook_url: str, service: NOTIFICATION, http: HttpClient) -> None:
         self.logger = logger
         self.WEBHOOK_URL = webhook_url
         self.SERVICE = service
         self.TIMEOUT = 30
+        self.http = http
 
-    def send_notification(self, message: str, severity: str) -> None:
+    @traced()
+    def send_notification(self, message: str, severity: str) -> tuple[bool, float]:
+        """
+        Returns:
+            tuple(bool, float): whether the message was accepted, seconds the service asked to wait before the next one when rate limited (0 otherwise)
+        """
         if not self.WEBHOOK_URL or not self.SERVICE:
                 self.logger.error("Notification service or webhook URL is not set. Skipping notification.")
-                return
+                return (False, 0)
 
         payload = {}
         headers = {}
@@ -52,11 +63,31 @@ class Notification:
             }
 
         try:
-            response = requests.post(
+            # POST is never retried by the client, a resend could post the message twice
+            response = self.http.post(
                 self.WEBHOOK_URL,
                 json = payload,
                 headers = headers,
                 timeout = self.TIMEOUT)
+            if response.status_code == 429:
+                retry_after = self.retry_after(response)
+                self.logger.warning(f"Notification rate limited, retry in {retry_after:.1f}s.")
+                return (False, retry_after)
             response.raise_for_status()
         except requests.RequestException as e:
             self.logger.error(f"Failed to send notification: {e}")
+            return (False, 0)
+        return (True, 0)
+
+    def retry_after(self, response: requests.Response) -> float:
+        """ Seconds from the Retry-After header, Discord also puts them in the JSON body. Neither present means a short default wait """
+        value = response.headers.get("Retry-After")
+        if value is None:
+            try:
+                value = response.json().get("retry_after")
+            except (ValueError, AttributeError):
+                value = None
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            return 5.0
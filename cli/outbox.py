@@ -0,0 +1,113 @@
+import os
+from datetime import datetime, timedelta
+from cli import lock
+from cli.notification import Notification, MESSAGE_LIMIT
+from db import db_queries
+from db.model.tbl_notification_outbox import NotificationOutboxDB
+from log.log import Log
+from log.trace import traced
+
+# Entries picked up per run, anything beyond waits for the next one
+BATCH_SIZE = 500
+# Failed sends back off up to this many seconds, a rate limit waits for the Retry-After the service asked for
+BACKOFF_MAX = 3600
+# Delivered entries are kept this long as a record of what was sent
+KEEP_DELIVERED = timedelta(days = 7)
+
+class Outbox:
+    """
+        Deliver notifications queued by DB_Query.set_notified, in the same transaction that flagged the torrents.
+        Entries are grouped per Arr into messages under the service limit and only marked delivered once the service accepted them.
+        Never sleeps: a rate limit or failure defers what is left to a later run, a crash in between resends at most one message
+    """
+    def __init__(self, logger:Log, notification:Notification, lock_dir:str, limit:int = MESSAGE_LIMIT) -> None:
+        self.logger = logger
+        self.notification = notification
+        self.lock_dir = lock_dir
+        self.limit = limit
+
+    @traced()
+    def deliver(self, db_query:db_queries.DB_Query) -> int:
+        """
+        Returns:
+            int: entries delivered by this call
+        """
+        outbox_lock = lock.outbox_lock(self.lock_dir)
+        # Another run is already delivering, what is left here is due on its next pass
+        if not outbox_lock.acquire():
+            return 0
+        try:
+            db_query.prune_notifications(datetime.now() - KEEP_DELIVERED)
+            pending = db_query.get_pending_notifications(BATCH_SIZE)
+            delivered = 0
+            chunks = self.chunks(pending)
+            for (idx, (message, severity, ids)) in enumerate(chunks):
+                (sent, retry_after) = self.notification.send_notification(message, severity)
+                if sent:
+                    db_query.mark_notifications_delivered(ids)
+                    delivered += len(ids)
+                    continue
+
+                remaining = [entry_id for (_, _, chunk_ids) in chunks[idx:] for entry_id in chunk_ids]
+                # A rate limit is not the message's fault, only real failures count toward MAX_ATTEMPTS
+                if retry_after > 0:
+                    wait = retry_after
+                else:
+                    attempts = max(entry.attempts for entry in pending if entry.id in ids)
+                    wait = min(BACKOFF_MAX, 30 * 2 ** attempts)
+                db_query.defer_notifications(remaining, datetime.now() + timedelta(seconds = wait), failed = retry_after == 0)
+                self.logger.warning("%s notifications not delivered, next try in %.0f seconds.", len(remaining), wait)
+                break
+            return delivered
+        finally:
+            outbox_lock.release()
+
+    def chunks(self, entries:list[NotificationOutboxDB]) -> list[tuple[str, str, list[int]]]:
+        """
+        Pack entries into messages of at most limit characters, one section per Arr and outcome like a single run used to send.
+        A section split over several messages repeats its header
+
+        Returns:
+            list[tuple(str, str, list[int])]: message, severity, outbox ids it carries
+        """
+        sections:dict[tuple[str, bool], list[NotificationOutboxDB]] = {}
+        for entry in entries:
+            sections.setdefault((entry.label, entry.transferred), []).append(entry)
+
+        # Split first, headers carry the count of what each message actually lists
+        messages:list[list[tuple[str, bool, list[tuple[int, str]]]]] = [[]]
+        size = 0
+        for ((label, transferred), section) in sections.items():
+            # Header with the whole section count is the longest it can get
+            header_size = len(self.header(label, transferred, len(section)))
+            lines:list[tuple[int, str]] = []
+            messages[-1].append((label, transferred, lines))
+            size += header_size
+            for entry in section:
+                line = os.path.basename(entry.torrent_name) if transferred else f"{os.path.basename(entry.torrent_name)}: {entry.error}"
+                # One line can never fit on its own, cut it rather than holding the whole outbox back
+                line = line[:self.limit - header_size - 1] + "\n"
+                # Anything besides this header already in the message, start the next one
+                if size + len(line) > self.limit and size > header_size:
+                    lines = []
+                    messages.append([(label, transferred, lines)])
+                    size = header_size
+                lines.append((entry.id, line))
+                size += len(line)
+
+        chunks:list[tuple[str, str, list[int]]] = []
+        for groups in messages:
+            message = ""
+            ids:list[int] = []
+            for (label, transferred, lines) in groups:
+                if len(lines) == 0:
+                    continue
+                message += self.header(label, transferred, len(lines)) + "".join(line for (_, line) in lines)
+                ids.extend(entry_id for (entry_id, _) in lines)
+            if len(ids) > 0:
+                severity = "error" if any(not transferred for (_, transferred, lines) in groups if len(lines) > 0) else "message"
+                chunks.append((message, severity, ids))
+        return chunks
+
+    def header(self, label:str, transferred:bool, count:int) -> str:
+        return f"Transferred {count} new {label} torrents:\n" if transferred else f"Transferred failed for {count} {label} torrents:\n"
@@ -1,33 +1,27 @@
 import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
 from model.torrent import Torrent
 from pwd import getpwnam
 from grp import getgrnam
 import logging
+from log.trace import traced
 
 class Permission:
-    def __init__(self) -> None:
+    def __init__(self, workers:int = 4) -> None:
         self.logger = logging.getLogger()
+        # Torrents are independent trees, fix them in parallel
+        self.workers = max(1, workers)
 
+    @traced()
     def update_permission(self, host_dir:str, paths: list[Torrent], chown_uid:str, chown_gid:str, chmod:str = ""):
         # Do not restrict user to use both chmod and chown, handle them separately for freedom
-        if chmod:
-            chmod_val = self._get_chmod_enums(chmod)
-            for torrent in paths:
-                parent_dir = os.path.join(os.path.join(host_dir, torrent.path))
-                try:
-                    os.chmod(parent_dir, chmod_val)
-                except IOError as e:
-                    self.logger.error("os.chmod raised an error: %s", e)
-
-                for (new_base, dirs, files) in os.walk(parent_dir):
-                    os.chmod(new_base, chmod_val)
-                    # We dont do dirs, due to they will be new_base on next iteration
-                    for file in files:
-                        os.chmod(os.path.join(new_base, file), chmod_val)
+        chmod_val = self._get_chmod_enums(chmod) if chmod else -1
 
+        # -1 leave owner/group untouched, same as os.chown
+        chown_uid_valid: int = -1
+        chown_gid_valid: int = -1
         if (chown_uid and chown_gid):
-            chown_uid_valid: int = 0
-            chown_gid_valid: int = 0
             try:
                 chown_uid_valid = int(chown_uid)
                 chown_gid_valid = int(chown_gid)
@@ -35,14 +29,66 @@ class Permission:
                 # This is good exception, lets fetch uid and gid
                 (chown_uid_valid, chown_gid_valid) = self._get_uid_gid_from_name(chown_uid, chown_gid)
 
-            for torrent in paths:
-                parent_dir = os.path.join(os.path.join(host_dir, torrent.path))
-                os.chown(parent_dir, chown_uid_valid, chown_gid_valid)
-                for (new_base, dirs, files) in os.walk(parent_dir):
-                    os.chown(new_base, chown_uid_valid, chown_gid_valid)
-                    # We dont do dirs, due to they will be new_base on next iteration
-                    for file in files:
-                        os.chown(os.path.join(new_base, file), chown_uid_valid, chown_gid_valid)
+        if chmod_val == -1 and chown_uid_valid == -1:
+            return
+        if len(paths) == 0:
+            return
+
+        with ThreadPoolExecutor(max_workers = min(self.workers, len(paths))) as executor:
+            futures = [executor.submit(self._fix_tree, os.path.join(host_dir, torrent.path), chmod_val, chown_uid_valid, chown_gid_valid) for torrent in paths]
+            for future in futures:
+                future.result()
+
+    def _fix_entry(self, name:str, st:os.stat_result, dir_fd:int | None, chmod_val:int, uid:int, gid:int) -> None:
+        # Only touch what differs, rsync usually already got most of it right
+        if chmod_val != -1 and stat.S_IMODE(st.st_mode) != chmod_val:
+            os.chmod(name, chmod_val, dir_fd = dir_fd)
+        if uid != -1 and (st.st_uid != uid or st.st_gid != gid):
+            os.chown(name, uid, gid, dir_fd = dir_fd, follow_symlinks = False)
+
+    def _fix_tree(self, parent_dir:str, chmod_val:int, uid:int, gid:int) -> None:
+        """
+        Single pass over the tree, chmod and chown together.
+        Directory fd + scandir so every stat/chmod/chown is relative to an open dir (fstatat/fchmodat/fchownat),
+        no path lookup from root per file and no second walk. Symlinks are skipped, never follow them out of the tree
+        """
+        try:
+            st = os.stat(parent_dir, follow_symlinks = False)
+        except OSError as e:
+            self.logger.error("Cannot stat %s: %s", parent_dir, e)
+            return
+        if stat.S_ISLNK(st.st_mode):
+            return
+
+        try:
+            self._fix_entry(parent_dir, st, None, chmod_val, uid, gid)
+        except OSError as e:
+            self.logger.error("Permission update raised an error on %s: %s", parent_dir, e)
+        if not stat.S_ISDIR(st.st_mode):
+            return
+
+        stack = [parent_dir]
+        while len(stack) > 0:
+            current = stack.pop()
+            try:
+                dir_fd = os.open(current, os.O_RDONLY | os.O_DIRECTORY)
+            except OSError as e:
+                self.logger.error("Cannot open %s: %s", current, e)
+                continue
+            try:
+                with os.scandir(dir_fd) as entries:
+                    for entry in entries:
+                        try:
+                            entry_stat = entry.stat(follow_symlinks = False)
+                            if stat.S_ISLNK(entry_stat.st_mode):
+                                continue
+                            self._fix_entry(entry.name, entry_stat, dir_fd, chmod_val, uid, gid)
+                            if stat.S_ISDIR(entry_stat.st_mode):
+                                stack.append(os.path.join(current, entry.name))
+                        except OSError as e:
+                            self.logger.error("Permission update raised an error on %s: %s", os.path.join(current, entry.name), e)
+            finally:
+                os.close(dir_fd)
 
     def _get_chmod_enums(self, chmod:str) -> int:
         # Owner = 7 * 64 = 448 = stat.S_IRWXU (Allow everything)
@@ -70,4 +116,4 @@ class Permission:
 
 
     def _get_uid_gid_from_name(self, uname:str, group:str) -> tuple[int, int]:
-        return (getpwnam(uname).pw_uid, getgrnam(group).gr_gid)
\ No newline at end of file
+        return (getpwnam(uname).pw_uid, getgrnam(group).gr_gid)
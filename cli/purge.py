@@ -0,0 +1,60 @@
+import os
+import shutil
+from concurrent.futures import Future, ThreadPoolExecutor
+from cli.rsync import PARTIAL_DIR
+from log.log import Log
+from log.trace import traced
+
+class Purge:
+    """
+        Background deletion of imported torrents so big rmtree on spinning disks does not hold up transfers.
+        Deletion only touch the filesystem, callers flag purged rows in DB for whatever actually got removed.
+    """
+    def __init__(self, logger:Log, workers:int = 2) -> None:
+        self.logger = logger
+        self.executor = ThreadPoolExecutor(max_workers = max(1, workers), thread_name_prefix = "purge")
+
+    def submit(self, arr_dir:str, torrent_names:list[str]) -> list[tuple[str, Future]]:
+        """
+        Queue deletion of every torrent under arr_dir, returns right away
+
+        Returns:
+            list(tuple[str, Future]): torrent name with its pending deletion
+        """
+        return [(torrent_name, self.executor.submit(self._remove, os.path.join(arr_dir, torrent_name))) for torrent_name in torrent_names]
+
+    @traced()
+    def wait(self, jobs:list[tuple[str, Future]]) -> tuple[list[str], list[str]]:
+        """
+        Returns:
+            tuple(list[str], list[str]): torrent names removed, torrent names that failed (retried next run)
+        """
+        purged = []
+        failed = []
+        for (torrent_name, future) in jobs:
+            if future.result():
+                purged.append(torrent_name)
+            else:
+                failed.append(torrent_name)
+        return (purged, failed)
+
+    def _remove(self, path:str) -> bool:
+        # A single file torrent that never finished (abandoned, cancelled) left its partial copy in rsync's partial dir next to it
+        partial = os.path.join(os.path.dirname(path), PARTIAL_DIR, os.path.basename(path))
+        removed = True
+        for target in [path, partial]:
+            # Already gone (user cleaned up, or Arr moved it) counts as purged
+            if not os.path.lexists(target):
+                continue
+            try:
+                if os.path.isdir(target) and not os.path.islink(target):
+                    shutil.rmtree(target)
+                else:
+                    os.remove(target)
+            except OSError as e:
+                self.logger.error("Failed to purge %s, will retry next run: %s", target, e)
+                removed = False
+        return removed
+
+    def close(self) -> None:
+        self.executor.shutdown(wait = True)
@@ -1,71 +1,217 @@
 import os
+import re
+import shlex
+import time
 import psutil
 import subprocess
-from enum import Enum
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from model.torrent import Torrent
 from log.log import Log
+from log.trace import traced, LOG_DIR
 
-class ARR(Enum):
-    SONARR = "tv-sonarr"
-    RADARR = "radarr"
+# Incomplete files are kept here (relative to each file's destination dir) so an interrupted transfer resumes from them
+PARTIAL_DIR = ".rsync-partial"
 
-SONARR = ARR.SONARR
-RADARR = ARR.RADARR
+# --info=progress2 line, e.g. "  1,234,567,890  45%   12.34MB/s    0:01:10 (xfr#3, to-chk=10/20)"
+PROGRESS_LINE = re.compile(r"^\s*([\d,.]+)\s+(\d+)%\s+(\S+/s)\s+(\S+)")
 
 class Rsync:
-    def __init__(self, logger:Log) -> None:
+    """
+        Spread torrents across multiple concurrent rsync streams.
+        A single TCP stream tops out well below line rate on a long fat pipe, so each worker runs its own rsync.
+    """
+    def __init__(self, logger:Log, workers:int = 1, progress_interval:int = 30, chown:str = "", chmod:str = "", job_dir:str = "", slot = None, bwlimit:int = 0, detached_workers:int = 0) -> None:
         self.logger = logger
+        self.workers = max(1, workers)
+        # Seconds between live progress log lines per torrent, 0 to disable
+        self.progress_interval = progress_interval
+        # Let rsync set owner and mode while writing, so no permission pass is needed afterwards
+        self.chown = chown
+        self.chmod = chmod
+        # Output and exit status files of detached transfers, picked up by TransferJobs.reap on a later run
+        self.job_dir = job_dir
+        # Callable returning a context manager held around each foreground rsync (Scheduler.slot), None for no global limit
+        self.slot = slot if slot is not None else nullcontext
+        # KiB/s per rsync, caller split the global TRANSFER_BWLIMIT across every stream that can run at once. 0 for unlimited
+        self.bwlimit = bwlimit
+        # Detached rsync never take a slot, they are capped up front at this instance's fixed share of TRANSFER_SLOTS instead. 0 for no cap
+        self.detached_workers = detached_workers
+
+    def _balance(self, sources:list[Torrent], workers:int) -> list[list[Torrent]]:
+        """
+        List scheduling in the given order, next torrent always goes to the least loaded worker.
+        Sources come in scheduled order (Scheduler.order) and each worker runs its list front to back, so that order is kept per worker.
+        Torrents with unknown size (0) count as 1 byte so they still get spread round robin.
+
+        Returns:
+            list(list[Torrent]): One list of torrents per worker, empty workers are dropped
+        """
+        bins:list[list[Torrent]] = [[] for _ in range(min(workers, len(sources)))]
+        loads = [0] * len(bins)
+        for torrent in sources:
+            idx = loads.index(min(loads))
+            bins[idx].append(torrent)
+            loads[idx] += max(torrent.size, 1)
+        return [worker for worker in bins if len(worker) > 0]
 
-    def transfer_from_remote(self, user:str, seedbox_endpoint:str, sources:list[Torrent], destination:str, port:int, arr_name:ARR) -> (bool, str):
+    def _build_command(self, user:str, seedbox_endpoint:str, sources:list[Torrent], destination:str, port:int, ssh_command:str) -> list[str]:
         sources_full_path = [f"{user}@{seedbox_endpoint}:{source.full_path}" for source in sources]
         options = ["--archive",
                     "--no-compress", # --compress might be killing performance, in face we specifically use no-compress
-                    "--whole-file",
+                    # Keep what an interrupted transfer already received, next attempt use it as basis and only fetch the rest.
+                    # No --whole-file, delta transfer is what makes the partial file count. New files have no basis and are sent whole anyway
+                    f"--partial-dir={PARTIAL_DIR}",
                     "--sparse",
                     "--acls",
                     "--xattrs",
                     "--executability",
-                    "--verbose" ,
+                    # Overall progress instead of per file listing, one short line that keeps being rewritten
+                    "--info=progress2",
                     "-e" ,
-                    "ssh -p " + str(port)]
-        self.logger.info("Initialized %s Rsync transferring sources: %s", arr_name.value, sources)
+                    # Reuse multiplexed SSH transport if provided, avoid another handshake per transfer
+                    ssh_command if ssh_command else "ssh -p " + str(port)]
 
-        if not os.path.exists(destination):
-            self.logger.error("Destination folder %s does not exist. Please double check path", destination)
-            exit(1)
+        if self.bwlimit > 0:
+            options.append(f"--bwlimit={self.bwlimit}")
+        if self.chown:
+            options.append(f"--chown={self.chown}")
+        if self.chmod:
+            # Same mode for dirs and files, matches Permission.update_permission
+            options.append(f"--chmod=D{self.chmod},F{self.chmod}")
 
-        command = [
+        return [
             "rsync",
             *options, # unpack the list into individual strings
             *sources_full_path,
             destination
         ]
 
+    def _parse_progress(self, line:str) -> tuple[int, int, str] | None:
+        """
+        Returns:
+            tuple(int, int, str): bytes so far, percent, current rate. None if line is not a progress line
+        """
+        match = PROGRESS_LINE.match(line)
+        if match is None:
+            return None
+        return (int(re.sub(r"[^\d]", "", match.group(1))), int(match.group(2)), match.group(3))
+
+    @traced()
+    def _run_worker(self, worker_id:int, pending:deque[Torrent], command_args:dict) -> None:
+        # Workers pull from one shared queue in scheduled order, whoever is free next takes the next torrent.
+        # One rsync per torrent inside a worker, so every torrent gets its own exit status
+        while True:
+            try:
+                torrent = pending.popleft()
+            except IndexError:
+                return
+            with self.slot():
+                self._transfer(worker_id, torrent, command_args)
+
+    def _transfer(self, worker_id:int, torrent:Torrent, command_args:dict) -> None:
+        command = self._build_command(sources = [torrent], **command_args)
+        self.logger.debug("Rsync worker %s transferring %s", worker_id, torrent.full_path)
+
+        # Stream output line by line instead of communicate() buffering everything until exit.
+        # Universal newlines turn progress2 "\r" rewrites into separate lines
+        start = time.monotonic()
+        last_log = start
+        errors:deque[str] = deque(maxlen = 20)
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace", bufsize=1)
+        for line in process.stdout:
+            progress = self._parse_progress(line)
+            if progress is None:
+                if line.strip():
+                    errors.append(line.strip())
+                continue
+
+            torrent.bytes_transferred = progress[0]
+            now = time.monotonic()
+            if self.progress_interval > 0 and now - last_log >= self.progress_interval:
+                last_log = now
+                self.logger.info("Rsync worker %s %s: %s%% %s bytes at %s", worker_id, torrent.path, progress[1], progress[0], progress[2])
+        process.wait()
+        torrent.transfer_seconds = time.monotonic() - start
+        torrent.exit_code = process.returncode
+
+        torrent.transferred = process.returncode == 0
+        torrent.transfer_error = "" if torrent.transferred else f"rsync exit code {process.returncode}: {' '.join(errors)}"
+        if torrent.transferred:
+            self.logger.info("Rsync worker %s finished %s: %s bytes in %.1fs (%.2f MB/s)", worker_id, torrent.path, torrent.bytes_transferred, torrent.transfer_seconds, torrent.transfer_rate / 1000 / 1000)
+        else:
+            self.logger.error("Rsync worker %s failed on %s: %s", worker_id, torrent.path, torrent.transfer_error)
+
+    def _spawn_detached(self, worker_id:int, torrents:list[Torrent], command_args:dict, arr_name:str) -> None:
+        """
+        One detached shell per worker running one rsync per torrent, each exit code written to the torrent's own status file.
+        Shell inherit the transfer locks, torrents stay in flight until it exits
+        """
+        job_dir = self.job_dir or os.path.join(LOG_DIR, "transfers")
+        os.makedirs(job_dir, exist_ok = True)
+        stamp = f"{arr_name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{worker_id}"
+        log_file = os.path.join(job_dir, f"{stamp}.log")
+
+        script = []
+        for (idx, torrent) in enumerate(torrents):
+            torrent.log_file = log_file
+            torrent.status_file = os.path.join(job_dir, f"{stamp}-{idx}.status")
+            command = shlex.join(self._build_command(sources = [torrent], **command_args))
+            script.append(f"{command}; echo $? > {shlex.quote(torrent.status_file)}")
+
+        # From a file, one argument holding a few thousand rsync commands goes over the kernel's per argument limit (128 KiB).
+        # Removes itself once every rsync exited, the log and status files stay for TransferJobs.reap
+        script_file = os.path.join(job_dir, f"{stamp}.sh")
+        script.append('rm -f "$0"')
+        with open(script_file, "w", encoding = "utf-8") as file:
+            file.write("\n".join(script) + "\n")
+
+        with open(log_file, "ab") as log:
+            process = subprocess.Popen(["sh", script_file],
+                                       stdin = subprocess.DEVNULL,
+                                       stdout = log,
+                                       stderr = subprocess.STDOUT,
+                                       start_new_session = True,
+                                       pass_fds = [torrent.lock_fd for torrent in torrents if torrent.lock_fd is not None])
+        self.logger.info("Rsync worker %s detached as PID %s for %s torrents, output in %s", worker_id, process.pid, len(torrents), log_file)
+
+        for torrent in torrents:
+            torrent.detached = True
+            torrent.pid = process.pid
+
+    @traced()
+    def transfer_from_remote(self, user:str, seedbox_endpoint:str, sources:list[Torrent], destination:str, port:int, arr_name:str, ssh_command:str = "") -> list[Torrent]:
+        """
+        Transfer sources over up to self.workers concurrent rsync streams, in the order given.
+
+        Returns:
+            list[Torrent]: sources, each with transferred and transfer_error set for that torrent. Detached torrents only carry pid, log_file and status_file
+
+        Raises:
+            FileNotFoundError: destination is missing (e.g. not mounted), only this instance's run fails
+        """
+        self.logger.info("Initialized %s Rsync transferring sources: %s", arr_name, sources)
+
+        if not os.path.exists(destination):
+            raise FileNotFoundError(f"Destination folder {destination} does not exist. Please double check path")
+
+        command_args = dict(user = user, seedbox_endpoint = seedbox_endpoint, destination = destination, port = port, ssh_command = ssh_command)
+        worker_count = min(self.workers, len(sources))
+        self.logger.info("%s Rsync using %s workers for %s torrents", arr_name, worker_count, len(sources))
+
         # Run in foreground (blocking) if running by Systemd (PID1), running in background with (PID1) will crash rsync
         if psutil.Process(os.getpid()).ppid() == 1:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            _, stderr = process.communicate()
-
-            if process.returncode != 0:
-                return (False, stderr)
-            else:
-                return (True, "")
-        # If run by user, just run it in background, so we dont block the cli
+            pending = deque(sources)
+            with ThreadPoolExecutor(max_workers = worker_count) as executor:
+                futures = [executor.submit(self._run_worker, worker_id, pending, command_args) for worker_id in range(worker_count)]
+                for future in futures:
+                    future.result()
+        # If run by user, just run it in background, so we dont block the cli.
+        # Outcome is collected by TransferJobs.reap on a later run or daemon tick. Detached rsync outlive the run, they do not hold a slot
         else:
-            process = subprocess.Popen(command)
-            return (True, "")
+            workers = min(self.workers, self.detached_workers) if self.detached_workers > 0 else self.workers
+            for (worker_id, torrents) in enumerate(self._balance(sources, workers)):
+                self._spawn_detached(worker_id, torrents, command_args, arr_name)
 
-def check_running_state() -> bool:
-    """
-    Check if rsync is currently running.
-    """
-    try:
-        # No process found will return a non-zero exit code
-        subprocess.run(['pgrep', 'rsync'], capture_output=True, text=True, check=True)
-        # Rsync process found
-        return True
-    except subprocess.CalledProcessError as _:
-        # if e.returncode == 1:
-        #     # No rsync process found
-        #     return False
-        return False
+        return sources
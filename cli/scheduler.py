@@ -0,0 +1,91 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from log.log import Log
+from model.torrent import Torrent
+
+class Scheduler:
+    """
+        Decide which torrent is transferred next and how many rsync streams each Arr may run.
+        Shortest job first minimise the mean time until Arr can import, a torrent waiting longer than max_wait
+        jumps the queue so one big remux is not starved by a steady stream of episodes.
+        Slots are shared by every Arr: while several Arrs have work each one is guaranteed an equal share,
+        an Arr only borrows a slot above its share when nobody below their share is waiting for it.
+    """
+    def __init__(self, logger:Log, slots:int = 0, max_wait:int = 3600) -> None:
+        self.logger = logger
+        # 0 means no global limit, every Arr only bounded by its own rsync workers
+        self.slots = slots
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._active:dict[str, int] = {}
+        self._running:dict[str, int] = {}
+        self._waiting:dict[str, int] = {}
+
+    def order(self, torrents:list[Torrent], first_enqueued:dict[str, datetime], now:datetime | None = None) -> list[Torrent]:
+        """
+        Starved torrents first (oldest first), then smallest first. Unknown size (0) goes last, it could be anything
+
+        Args:
+            first_enqueued(dict[str, datetime]): When each torrent was first queued for transfer, missing means just now
+        """
+        now = now if now is not None else datetime.now()
+        ages = {torrent.path: (now - first_enqueued[torrent.path]).total_seconds() if torrent.path in first_enqueued else 0.0 for torrent in torrents}
+
+        starved = [torrent for torrent in torrents if self.max_wait > 0 and ages[torrent.path] >= self.max_wait]
+        starved.sort(key = lambda torrent: ages[torrent.path], reverse = True)
+        rest = [torrent for torrent in torrents if not (self.max_wait > 0 and ages[torrent.path] >= self.max_wait)]
+        rest.sort(key = lambda torrent: (torrent.size <= 0, torrent.size, -ages[torrent.path]))
+
+        if len(starved) > 0:
+            self.logger.info("%s torrents waited over %ss, transferring them first: %s", len(starved), self.max_wait, [torrent.path for torrent in starved])
+        return starved + rest
+
+    @contextmanager
+    def demand(self, arr:str):
+        """ Count arr towards the fair share split for as long as it has transfers to run """
+        with self._cond:
+            self._active[arr] = self._active.get(arr, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[arr] -= 1
+                if self._active[arr] == 0:
+                    del self._active[arr]
+                self._cond.notify_all()
+
+    def share(self, arr:str) -> int:
+        """ Slots guaranteed to arr while every active Arr has work, at least 1 """
+        if self.slots <= 0:
+            return 0
+        active = len(self._active) if arr in self._active else len(self._active) + 1
+        return max(1, self.slots // max(1, active))
+
+    @contextmanager
+    def slot(self, arr:str):
+        """ Hold one transfer slot for arr, blocks until arr is allowed another rsync stream """
+        if self.slots <= 0:
+            yield
+            return
+
+        with self._cond:
+            self._waiting[arr] = self._waiting.get(arr, 0) + 1
+            self._cond.wait_for(lambda: self._can_run(arr))
+            self._waiting[arr] -= 1
+            self._running[arr] = self._running.get(arr, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[arr] -= 1
+                self._cond.notify_all()
+
+    def _can_run(self, arr:str) -> bool:
+        if sum(self._running.values()) >= self.slots:
+            return False
+        if self._running.get(arr, 0) < self.share(arr):
+            return True
+        # Over its share, only borrow an idle slot nobody with a smaller share is waiting for
+        return not any(waiting > 0 and self._running.get(other, 0) < self.share(other)
+                       for (other, waiting) in self._waiting.items() if other != arr)
@@ -0,0 +1,85 @@
+import os
+from cli import lock
+from cli.rsync import PROGRESS_LINE
+from db import db_queries
+from log.log import Log
+from log.trace import traced
+from model.arr_instance import ArrInstance
+from model.torrent import Torrent
+
+# Exit code recorded for a detached rsync that died before writing its status file (killed, reboot)
+KILLED = -1
+# Bytes read from the end of a job log for the failure message
+LOG_TAIL = 2048
+
+class TransferJobs:
+    """
+        Collect the outcome of detached rsync started by an earlier run.
+        Never waits on a transfer, a job is only looked at once nobody holds its transfer lock anymore
+    """
+    def __init__(self, logger:Log, lock_dir:str) -> None:
+        self.logger = logger
+        self.lock_dir = lock_dir
+
+    @traced()
+    def reap(self, db_query:db_queries.DB_Query, arr:ArrInstance, owned:set[str] | None = None) -> list[Torrent]:
+        """
+        Collect every finished detached transfer of arr with its real exit code.
+        Jobs stay running in DB until the caller verified and finished them (DB_Query.finish_transfers)
+
+        Args:
+            owned(set[str]): torrent names whose transfer lock the caller already holds, their detached rsync is done.
+                Probing those would only find our own lock
+
+        Returns:
+            list[Torrent]: reaped torrents with transferred, exit_code and transfer_error set
+        """
+        reaped:list[Torrent] = []
+        for job in db_query.get_detached_transfers(arr):
+            # Detached shell still holds the lock while any of its rsync runs
+            if job.torrent_name not in (owned or set()) and lock.transfer_lock(self.lock_dir, arr.name, job.torrent_name).is_held_elsewhere():
+                continue
+
+            # Daemon mode started it, collect the zombie. Not our child when started by an earlier one-shot run
+            try:
+                os.waitpid(job.pid, os.WNOHANG)
+            except ChildProcessError:
+                pass
+
+            torrent = Torrent(path = job.torrent_name, is_dir = False)
+            torrent.full_path = job.source or ""
+            torrent.exit_code = self._read_status(job.status_file)
+            torrent.transferred = torrent.exit_code == 0
+            if not torrent.transferred:
+                reason = "rsync was killed before finishing" if torrent.exit_code == KILLED else f"rsync exit code {torrent.exit_code}"
+                torrent.transfer_error = f"{reason}: {self._read_log_tail(job.log_file)}"
+            torrent.status_file = job.status_file or ""
+            reaped.append(torrent)
+
+        if len(reaped) > 0:
+            self.logger.info("Reaped %s detached %s transfers, %s failed.", len(reaped), arr.name, len([torrent for torrent in reaped if not torrent.transferred]))
+        return reaped
+
+    def cleanup(self, torrents:list[Torrent]) -> None:
+        """ Drop status files of reaped torrents once their outcome is persisted, a crash before that reaps them again """
+        for torrent in torrents:
+            if torrent.status_file and os.path.exists(torrent.status_file):
+                os.remove(torrent.status_file)
+
+    def _read_status(self, status_file:str | None) -> int:
+        try:
+            with open(status_file or "", encoding = "utf-8") as file:
+                return int(file.read().strip())
+        except (OSError, ValueError):
+            return KILLED
+
+    def _read_log_tail(self, log_file:str | None) -> str:
+        """ Last lines of the job log with progress2 lines dropped, flattened to one line """
+        try:
+            with open(log_file or "", "rb") as file:
+                file.seek(max(0, os.path.getsize(log_file) - LOG_TAIL))
+                tail = file.read().decode("utf-8", errors = "replace")
+        except OSError:
+            return "no log available"
+        lines = [line.strip() for line in tail.replace("\r", "\n").splitlines() if line.strip() and PROGRESS_LINE.match(line) is None]
+        return " ".join(lines[-5:])
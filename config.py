@@ -1,7 +1,10 @@
 import os
 from dotenv import load_dotenv
 
+# Keys .env actually set, a reload only drops these. Whatever the process environment (systemd) set wins and is kept
+_environ = set(os.environ)
 load_dotenv()
+DOTENV_KEYS:set[str] = set(os.environ) - _environ
 
 # Sonarr
 SONARR_ENDPOINT:str = os.getenv("SONARR_ENDPOINT", "")
@@ -13,6 +16,15 @@ RADARR_ENDPOINT:str = os.getenv("RADARR_ENDPOINT", "")
 RADARR_API_KEY:str = os.getenv("RADARR_API_KEY", "")
 RADARR_DEST_DIR:str = os.getenv("RADARR_DEST_DIR", "")
 
+# Optional, several Arr instances in one run, comma separated names e.g. "tv-sonarr,sonarr-4k,radarr,radarr-anime".
+# The single SONARR_*/RADARR_* setup runs as tv-sonarr and radarr, keep those names to carry its DB rows over
+# Each name is configured with <NAME>_TYPE (sonarr/radarr), <NAME>_ENDPOINT, <NAME>_API_KEY, <NAME>_SEEDBOX_PATH, <NAME>_DEST_DIR
+# and optional <NAME>_CATEGORY, upper cased with - as _. Omit to use the single SONARR_* and RADARR_* settings
+ARR_INSTANCES:list[dict[str, str]] = [
+    dict(name = name, **{key.lower(): os.getenv(f"{name.upper().replace('-', '_')}_{key}", "") for key in ["TYPE", "ENDPOINT", "API_KEY", "SEEDBOX_PATH", "DEST_DIR", "CATEGORY"]})
+    for name in dict.fromkeys(name.strip() for name in os.getenv("ARR_INSTANCES", "").split(",") if name.strip())
+]
+
 # Seedbox
 SEEDBOX_USERNAME:str = os.getenv("SEEDBOX_USERNAME", "")
 SEEDBOX_ENDPOINT:str = os.getenv("SEEDBOX_ENDPOINT", "")
@@ -20,6 +32,7 @@ SEEDBOX_PORT:int = int(os.getenv("SEEDBOX_PORT", "")) if os.getenv("SEEDBOX_PORT
 
 SEEDBOX_SONARR_TORRENT_PATH:str = os.getenv("SEEDBOX_SONARR_TORRENT_PATH", "")
 SEEDBOX_RADARR_TORRENT_PATH:str = os.getenv("SEEDBOX_RADARR_TORRENT_PATH", "")
+SEEDBOX_CONTROL_PATH:str = os.getenv("SEEDBOX_CONTROL_PATH", "") # OpenSSH ControlPath socket for rsync, defaults to ~/.ssh/cm-%C
 
 # Notification
 NOTIFICATION_SERVICE:str = os.getenv("NOTIFICATION_SERVICE", "") # Options: "apprise", "discord"
@@ -29,8 +42,28 @@ APPRISE_TAG:str = os.getenv("APPRISE_TAG", "") # Only for apprise notifications
 CHOWN_UID:str = os.getenv("CHOWN_UID", "")
 CHOWN_GID:str = os.getenv("CHOWN_GID", "")
 CHMOD:str = os.getenv("CHMOD", "")
+RSYNC_APPLY_PERMISSION:bool = os.getenv("RSYNC_APPLY_PERMISSION", "").lower() in ["true", "1", "t"] # Let rsync apply CHOWN/CHMOD (--chown/--chmod) instead of a pass after transfer
+PERMISSION_WORKERS:int = int(os.getenv("PERMISSION_WORKERS", "")) if os.getenv("PERMISSION_WORKERS", "").isdigit() else 4 # Torrents fixed in parallel by the permission pass
 
 DEV:bool = os.getenv("DEV", "").lower() in ["true", "1", "t"] # Set to True to remove and recreate the database for testing purposes
 VERBOSE:str = os.getenv("VERBOSE", "").lower() if os.getenv("VERBOSE", "").lower() in ["debug", "info", "error"] else "error" # Default to error log level
 DB_VERBOSE:bool = os.getenv("DB_VERBOSE", "").lower() in ["true", "1", "t"] # Set to True to enable database operation logging
-DB_PATH:str = os.getenv("DB_PATH", "")
+DB_PATH:str = os.getenv("DB_PATH", "db/database.db")
+ARR_FULL_VALIDATION:bool = os.getenv("ARR_FULL_VALIDATION", "").lower() in ["true", "1", "t"] # Validate every queue field with full pydantic models, debugging only
+RSYNC_WORKERS:int = int(os.getenv("RSYNC_WORKERS", "")) if os.getenv("RSYNC_WORKERS", "").isdigit() else 4 # Concurrent rsync streams per Arr
+RSYNC_PROGRESS_INTERVAL:int = int(os.getenv("RSYNC_PROGRESS_INTERVAL", "")) if os.getenv("RSYNC_PROGRESS_INTERVAL", "").isdigit() else 30 # Seconds between live transfer progress log lines, 0 to disable
+METRICS_TEXTFILE:str = os.getenv("METRICS_TEXTFILE", "") # node_exporter textfile collector path, e.g. /var/lib/node_exporter/rsync_seedbox.prom. Omit to disable
+TRACE:str = os.getenv("TRACE", "").lower() if os.getenv("TRACE", "").lower() in ["log", "json"] else "" # Per run timing tree, "log" or "json" (log/trace.json). Omit to disable
+PROFILE:str = os.getenv("PROFILE", "").lower() if os.getenv("PROFILE", "").lower() in ["cprofile", "tracemalloc"] else "" # Run main under "cprofile" or "tracemalloc", report is written to log/
+DAEMON_MIN_INTERVAL:int = int(os.getenv("DAEMON_MIN_INTERVAL", "")) if os.getenv("DAEMON_MIN_INTERVAL", "").isdigit() else 30 # --daemon poll interval in seconds while torrents are pending
+DAEMON_MAX_INTERVAL:int = int(os.getenv("DAEMON_MAX_INTERVAL", "")) if os.getenv("DAEMON_MAX_INTERVAL", "").isdigit() else 900 # --daemon poll interval backs off up to this when idle
+WEBHOOK_LISTEN:str = os.getenv("WEBHOOK_LISTEN", "") # --daemon only, "host:port" to receive Arr webhooks on /webhook/sonarr and /webhook/radarr, a bare port listens on loopback only. Omit to disable
+WEBHOOK_TOKEN:str = os.getenv("WEBHOOK_TOKEN", "") # Shared secret, Arr webhook password or ?token= in URL. Required, the listener does not start without it
+PURGE_WORKERS:int = int(os.getenv("PURGE_WORKERS", "")) if os.getenv("PURGE_WORKERS", "").isdigit() else 2 # Background threads deleting imported torrents
+LOCK_DIR:str = os.getenv("LOCK_DIR", "") or os.path.join(os.path.dirname(DB_PATH) or ".", "locks") # flock files for per Arr and per transfer locks, defaults next to the database
+TRANSFER_LOG_DIR:str = os.getenv("TRANSFER_LOG_DIR", "") # Output and exit status of background rsync, defaults to log/transfers
+TRANSFER_SLOTS:int = int(os.getenv("TRANSFER_SLOTS", "")) if os.getenv("TRANSFER_SLOTS", "").isdigit() else 0 # Concurrent rsync streams across all Arrs, split fairly while several Arrs have work. 0 for no global limit
+TRANSFER_MAX_WAIT:int = int(os.getenv("TRANSFER_MAX_WAIT", "")) if os.getenv("TRANSFER_MAX_WAIT", "").isdigit() else 3600 # Seconds a torrent may wait behind smaller ones before it is transferred first, 0 for pure smallest first
+TRANSFER_BWLIMIT:int = int(os.getenv("TRANSFER_BWLIMIT", "")) if os.getenv("TRANSFER_BWLIMIT", "").isdigit() else 0 # KiB/s across every rsync of every Arr instance, 0 for unlimited
+HTTP_RETRIES:int = int(os.getenv("HTTP_RETRIES", "")) if os.getenv("HTTP_RETRIES", "").isdigit() else 3 # Retries with jittered backoff for Arr API calls on connection errors and 429/5xx, notifications are never resent
+CONCURRENT:bool = os.getenv("CONCURRENT", "true").lower() in ["true", "1", "t"] # Run Arr instance pipelines in parallel
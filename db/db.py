@@ -1,19 +1,72 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event, inspect, text
 from db.db_base import Base
 from abc import ABC
+from db.migrations import MIGRATIONS, LATEST_VERSION
 from db.model.tbl_radarr import RadarrDB
 from db.model.tbl_sonarr import SonarrDB
+from db.model.tbl_transfer_job import TransferJobDB
+from db.model.tbl_seedbox_listing import SeedboxListingDB
+from db.model.tbl_seedbox_entry import SeedboxEntryDB
+from db.model.tbl_notification_outbox import NotificationOutboxDB
 from log.log import Log
 
+DEFAULT_DB_PATH = "db/database.db"
+
 class DB(ABC):
 
-    def __init__(self, logger: Log) -> None:
+    def __init__(self, logger: Log, db_path: str = "", verbose: bool = False) -> None:
         self.logger = logger
+        self.db_path = db_path if db_path else DEFAULT_DB_PATH
         # Initialize the database connection and create tables if they do not exist
-        self.engine = create_engine('sqlite:///db/database.db')
-        Base.metadata.create_all(self.engine)
-    
+        self.engine = create_engine(f"sqlite:///{self.db_path}", echo = verbose)
+        event.listen(self.engine, "connect", self._set_pragma)
+        self._migrate()
+
     def get_engine(self):
         return self.engine
 
+    @staticmethod
+    def _set_pragma(dbapi_connection, _) -> None:
+        # WAL lets the Arr pipelines read while another one writes, and each commit is no longer a full fsync of the db.
+        # synchronous=NORMAL is durable in WAL mode except on power loss, worst case we retry a transfer
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    def _migrate(self) -> None:
+        """
+        Bring schema up to LATEST_VERSION in place.
+        Up to date database skip create_all entirely, only one PRAGMA read per run.
+        """
+        with self.engine.connect() as conn:
+            version = conn.execute(text("PRAGMA user_version")).scalar() or 0
+        if version >= LATEST_VERSION:
+            return
 
+        # Fresh database get the latest schema straight from the models, migrations are only for existing tables
+        if not inspect(self.engine).has_table(SonarrDB.__tablename__):
+            self.logger.info("Creating database %s at schema version %s", self.db_path, LATEST_VERSION)
+            Base.metadata.create_all(self.engine)
+            with self.engine.begin() as conn:
+                conn.execute(text(f"PRAGMA user_version = {int(LATEST_VERSION)}"))
+            return
+
+        self.logger.info("Migrating database %s from schema version %s to %s", self.db_path, version, LATEST_VERSION)
+
+        # Tables added later are created by their own migration, create_all before them would add columns that a later ALTER adds again
+        for (migration_version, description, statements) in MIGRATIONS:
+            if migration_version <= version:
+                continue
+            self.logger.info("Applying migration %s: %s", migration_version, description)
+            with self.engine.begin() as conn:
+                for statement in statements:
+                    conn.execute(text(statement))
+                # PRAGMA does not take bound parameters
+                conn.execute(text(f"PRAGMA user_version = {int(migration_version)}"))
+
+        # Anything a migration does not cover (new index on a model) is still created
+        Base.metadata.create_all(self.engine)
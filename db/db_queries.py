@@ -1,29 +1,41 @@
 # type: ignore
 import os
-import shutil
 from datetime import datetime
 # from enums.enum import DB_ENUM
 import sqlalchemy
-from sqlalchemy import select, insert, update, and_
+from sqlalchemy import select, update, delete, and_, or_, case, bindparam, func
+from sqlalchemy.dialects.sqlite import insert
 from db.model.tbl_radarr import RadarrDB
 from db.model.tbl_sonarr import SonarrDB
-from enum import Enum
+from db.model.tbl_seedbox_listing import SeedboxListingDB
+from db.model.tbl_seedbox_entry import SeedboxEntryDB
+from db.model.tbl_transfer_job import TransferJobDB, QUEUED, RUNNING, DONE, FAILED, ABANDONED, ACTIVE_STATES
+from db.model.tbl_notification_outbox import NotificationOutboxDB, MAX_ATTEMPTS
 from log.log import Log
+from log.trace import traced
+from model.arr_instance import ArrInstance, SONARR
 from model.torrent import Torrent
-
-class ARR(Enum):
-    SONARR = "tv-sonarr"
-    RADARR = "radarr"
-
-SONARR = ARR.SONARR
-RADARR = ARR.RADARR
+from cli import lock
+from cli.purge import Purge
 
 class DB_Query:
     def __init__(self, logger: Log, engine: sqlalchemy.Engine) -> None:
         self.logger = logger
         self.session = engine.connect()
+        self.IN_CHUNK_SIZE = 500
+
+    def close(self) -> None:
+        """ Give the connection back to the pool, an open one also holds a WAL read transaction """
+        self.session.close()
 
-    def mark_db_complete(self, torrents:list[Torrent], arr_name:ARR) -> None:
+    def __enter__(self) -> "DB_Query":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    @traced()
+    def mark_db_complete(self, torrents:list[Torrent], arr:ArrInstance) -> None:
         """
             Mark database entries not existing in API as completed
             It either:
@@ -32,133 +44,408 @@ class DB_Query:
             It will not mark as complete if:
                 1. Title mismatch and require manual intervention
         """
-        stmt = None
-        if arr_name == SONARR:
-            # Done try to change "== False", I tried "is False" and "not var_name", both does not work
-            stmt = select(SonarrDB).where(and_(SonarrDB.torrent_name.not_in([torrent.path for torrent in torrents]), SonarrDB.import_complete == False))
-        elif arr_name == RADARR:
-            stmt = select(RadarrDB).where(and_(RadarrDB.torrent_name.not_in([torrent.path for torrent in torrents]), RadarrDB.import_complete == False))
+        database = self._table(arr)
+        # Done try to change "== False", I tried "is False" and "not var_name", both does not work
+        condition = and_(database.arr == arr.name, database.torrent_name.not_in([torrent.path for torrent in torrents]), database.import_complete == False)
 
-        result_set = self.session.execute(stmt).all()
+        result_set = self.session.execute(select(database).where(condition)).all()
         if len(result_set) == 0:
-            self.logger.info(f"No entries to mark as complete in {arr_name.value} database.")
+            self.logger.info(f"No entries to mark as complete in {arr.name} database.")
             return
         else:
-            self.logger.info(f"Found {len(result_set)} entries to mark as complete in {arr_name.value} database.")
-
-        if arr_name == SONARR:
-            stmt = update(SonarrDB).where(and_(SonarrDB.torrent_name.not_in([torrent.path for torrent in torrents]), SonarrDB.import_complete == False)).values(dict(import_complete = True, completed_on = datetime.now()))
-        else:
-            stmt = update(RadarrDB).where(and_(RadarrDB.torrent_name.not_in([torrent.path for torrent in torrents]), RadarrDB.import_complete == False)).values(dict(import_complete = True, completed_on = datetime.now()))
+            self.logger.info(f"Found {len(result_set)} entries to mark as complete in {arr.name} database.")
 
+        stmt = update(database).where(condition).values(dict(import_complete = True, completed_on = datetime.now()))
         self.session.execute(stmt)
         self.session.commit()
     
-    def purge_local_complete_content(self, arr_dir: str, arr_name: ARR) -> None:
-        """ Cleanup local files that finish import process """
-
-        stmt = None
-        if arr_name == SONARR:
-            stmt = select(SonarrDB).where(and_(SonarrDB.import_complete == True, SonarrDB.purged == False))
-        elif arr_name == RADARR:
-            stmt = select(RadarrDB).where(and_(RadarrDB.import_complete == True, RadarrDB.purged == False))
-
-        result_set = self.session.execute(stmt).all()
-        self.logger.info("Purging %s items from %s local directory.", len(result_set), arr_name.value)
-
-        purge_list = []
-        if arr_name == SONARR:
-            purge_list = [SonarrDB(*result) for result in result_set]
-        elif arr_name == RADARR:
-            purge_list = [RadarrDB(*result) for result in result_set]
-
-        for path in [os.path.join(arr_dir, arr.torrent_name) for arr in purge_list]:
-            if os.path.exists(path) and not os.path.islink(path):
-                if os.path.isdir(path):
-                    shutil.rmtree(path)
-                else:
-                    os.remove(path)
-
-        if arr_name == SONARR:
-            stmt = update(SonarrDB).where(SonarrDB.torrent_name.in_([arr.torrent_name for arr in purge_list])).values(purged = True)
-        elif arr_name == RADARR:
-            stmt = update(RadarrDB).where(RadarrDB.torrent_name.in_([arr.torrent_name for arr in purge_list])).values(purged = True)
+    @traced()
+    def mark_complete(self, torrent_names: list[str], arr: ArrInstance) -> None:
+        """ Mark specific torrents as completed, used when Arr tell us (webhook) an import finished """
+        if len(torrent_names) == 0:
+            return
 
-        self.session.execute(stmt)
+        database = self._table(arr)
+        for chunk in self._chunks(torrent_names):
+            stmt = update(database).where(and_(database.arr == arr.name, database.torrent_name.in_(chunk), database.import_complete == False)).values(dict(import_complete = True, completed_on = datetime.now()))
+            self.session.execute(stmt)
         self.session.commit()
-    
-    def check_torrents_and_get_full_path(self, torrents: list[Torrent], torrent_path:str, arr_name: ARR) -> list[Torrent]:
+
+    @traced()
+    def get_purge_candidates(self, arr: ArrInstance) -> list[str]:
+        """ Torrent names that finished import but are not purged yet, failed purges show up again here """
+        database = self._table(arr)
+        stmt = select(database.torrent_name).where(and_(database.arr == arr.name, database.import_complete == True, database.purged == False))
+        return [row.torrent_name for row in self.session.execute(stmt).all()]
+
+    @traced()
+    def mark_purged(self, arr: ArrInstance, torrent_names: list[str]) -> None:
+        """ Flag only what was actually removed, in one commit """
+        if len(torrent_names) == 0:
+            return
+
+        database = self._table(arr)
+        for chunk in self._chunks(torrent_names):
+            stmt = update(database).where(and_(database.arr == arr.name, database.torrent_name.in_(chunk))).values(purged = True)
+            self.session.execute(stmt)
+        self.session.commit()
+
+    @traced()
+    def purge_local_complete_content(self, arr_dir: str, arr: ArrInstance, purge_worker: Purge) -> int:
+        """ Cleanup local files that finish import process and wait for it, returns number of items purged """
+        torrent_names = self.get_purge_candidates(arr)
+        self.logger.info("Purging %s items from %s local directory.", len(torrent_names), arr.name)
+
+        (purged, _) = purge_worker.wait(purge_worker.submit(arr_dir, torrent_names))
+        self.mark_purged(arr, purged)
+        return len(purged)
+
+    @traced()
+    def check_torrents_and_get_full_path(self, torrents: list[Torrent], torrent_path:str, arr: ArrInstance) -> list[Torrent]:
+        """
+        Decide which torrents need a transfer and record the attempt.
+        All matching rows are loaded with one IN select, inserts and retry increments are worked out in memory
+        and applied as bulk statements in a single transaction (one fsync per Arr instead of one per torrent).
+        """
+        database = self._table(arr)
+
+        db_rows = self._get_torrents(arr, [torrent.path for torrent in torrents])
+
         need_transfer:list[Torrent] = []
+        new_torrents:list[Torrent] = []
+        seen:set[str] = set()
+        retry_torrents:list[Torrent] = []
         for torrent in torrents:
-            db_result = None
-            if arr_name == SONARR:
-                db_result = self._get_torrent(SonarrDB, torrent)
-            elif arr_name == RADARR:
-                db_result = self._get_torrent(RadarrDB, torrent)
+            # Same torrent can show up twice in a batch, only transfer it and count its attempt once
+            if torrent.path in seen:
+                continue
+            seen.add(torrent.path)
+            db_result = db_rows.get(torrent.path)
 
             if db_result is None:
                 torrent.notified = False
                 need_transfer.append(torrent)
-                if arr_name == SONARR:
-                    self._add_torrent(SonarrDB, torrent)
-                elif arr_name == RADARR:
-                    self._add_torrent(RadarrDB, torrent)
+                new_torrents.append(torrent)
             # Pylance lint error
             elif db_result.retries < 3 and not db_result.import_complete:
                 need_transfer.append(torrent)
-                if arr_name == SONARR:
-                    self._increment_retries(SonarrDB, torrent)
-                elif arr_name == RADARR:
-                    self._increment_retries(RadarrDB, torrent)
+                retry_torrents.append(torrent)
             elif db_result.retries == 3 and not db_result.notified and not db_result.import_complete:
                 # Send out a dc alert
-                self.logger.error("%s's torrent: %s reached 3 retries, please check manually", arr_name.value, os.path.dirname(torrent.path))
+                self.logger.error("%s's torrent: %s reached 3 retries, please check manually", arr.name, os.path.dirname(torrent.path))
             else:
                 torrent.notified = db_result.notified
-        
+
+        # One upsert covers both new torrents and retries, unique index on (arr, torrent_name) decide which branch a row takes.
+        # WHERE clause keeps a row that finished or ran out of retries (by another run in between) untouched
+        upsert_torrents = new_torrents + retry_torrents
+        if len(upsert_torrents) > 0:
+            stmt = insert(database).on_conflict_do_update(
+                index_elements = [database.arr, database.torrent_name],
+                set_ = dict(retries = database.retries + 1),
+                where = and_(database.import_complete == False, database.retries < 3))
+            self.session.execute(stmt, [dict(arr = arr.name, torrent_name = torrent.path) for torrent in upsert_torrents])
+        self.session.commit()
+        self.logger.debug("%s inserted %s and retried %s torrents in one transaction", arr.name, len(new_torrents), len(retry_torrents))
+
         # Return the full path of the seedbox torrents
         for torrent in need_transfer:
             torrent.full_path = os.path.join(torrent_path, torrent.path)
         return need_transfer
 
-    def set_notified(self, arr_name: ARR, torrent: Torrent) -> None:
-        database = None
-        if arr_name == SONARR:
-            database = SonarrDB
-        else:
-            database = RadarrDB
+    @traced()
+    def set_notified(self, arr: ArrInstance, torrents: list[Torrent], outbox: bool = False) -> None:
+        """
+        Flag every torrent as notified with bulk updates in one commit.
+        With outbox, the notification of each torrent is queued in that same commit, a crash can neither lose nor duplicate it
+        """
+        if len(torrents) == 0:
+            return
 
-        stmt = update(database).where(database.torrent_name == torrent.path).values(notified = True)
-        self.session.execute(stmt)
+        database = self._table(arr)
+
+        for chunk in self._chunks([torrent.path for torrent in torrents]):
+            stmt = update(database).where(and_(database.arr == arr.name, database.torrent_name.in_(chunk))).values(notified = True)
+            self.session.execute(stmt)
+        if outbox:
+            now = datetime.now()
+            self.session.execute(insert(NotificationOutboxDB), [dict(arr = arr.name,
+                                                                     label = arr.label,
+                                                                     torrent_name = torrent.path,
+                                                                     transferred = torrent.transferred,
+                                                                     error = torrent.transfer_error or None,
+                                                                     enqueued_on = now,
+                                                                     attempts = 0) for torrent in torrents])
         self.session.commit()
 
-    def _add_torrent(self, database, torrent: Torrent) -> None:
-        if self._check_exists(database, torrent):
-            self.logger.debug("Torrent \"%s\" already exists in the Radarr database.", torrent.path)
-            return None
-        self._insert(database, torrent)
+    @traced()
+    def get_pending_notifications(self, limit: int) -> list[NotificationOutboxDB]:
+        """ Undelivered outbox entries due now, oldest first """
+        stmt = select(NotificationOutboxDB).where(and_(NotificationOutboxDB.delivered_on.is_(None),
+                                                       NotificationOutboxDB.attempts < MAX_ATTEMPTS,
+                                                       or_(NotificationOutboxDB.next_attempt_on.is_(None), NotificationOutboxDB.next_attempt_on <= datetime.now()))).order_by(NotificationOutboxDB.id).limit(limit)
+        return [NotificationOutboxDB(**(result._asdict())) for result in self.session.execute(stmt).all()]
 
-    def _get_torrent(self, database, torrent: Torrent) -> RadarrDB | SonarrDB | None:
-        stmt = select(database).where(database.torrent_name == torrent.path)
-        result = self.session.execute(stmt).first()
-        if result is None:
-            return None
-        else:
-            # return database(result.id, result.torrent_name)
-            return database(**(result._asdict()))
+    @traced()
+    def mark_notifications_delivered(self, ids: list[int]) -> None:
+        for chunk in self._chunks(ids):
+            self.session.execute(update(NotificationOutboxDB).where(NotificationOutboxDB.id.in_(chunk)).values(delivered_on = datetime.now()))
+        self.session.commit()
 
-    def _increment_retries(self, database, torrent: Torrent) -> None:
-        # Pylance linting error
-        stmt = update(database).where(database.torrent_name == torrent.path).values(retries = database.retries + 1)
-        self.session.execute(stmt)
+    @traced()
+    def defer_notifications(self, ids: list[int], until: datetime, failed: bool) -> None:
+        """ Hold entries back until a later run, failed counts the attempt (a rate limit does not) """
+        values = dict(next_attempt_on = until, attempts = NotificationOutboxDB.attempts + 1) if failed else dict(next_attempt_on = until)
+        for chunk in self._chunks(ids):
+            self.session.execute(update(NotificationOutboxDB).where(NotificationOutboxDB.id.in_(chunk)).values(**values))
         self.session.commit()
 
-    def _check_exists(self, database, torrent: Torrent) -> bool:
-        stmt = select(database).where(database.torrent_name == torrent.path).limit(1)
-        result_set = self.session.execute(stmt)
-        return result_set.first() is not None
+    @traced()
+    def drop_pending_notifications(self) -> int:
+        """ Delete undelivered entries, for when notifications got turned off. Returns how many were dropped """
+        result = self.session.execute(delete(NotificationOutboxDB).where(NotificationOutboxDB.delivered_on.is_(None)))
+        self.session.commit()
+        return result.rowcount
 
-    def _insert(self, database, torrent: Torrent) -> None:
-        stmt = insert(database).values(torrent_name = torrent.path)
-        self.session.execute(stmt)
+    @traced()
+    def prune_notifications(self, before: datetime) -> None:
+        """ Delivered entries are only kept for a while as a record of what was sent """
+        self.session.execute(delete(NotificationOutboxDB).where(and_(NotificationOutboxDB.delivered_on.is_not(None), NotificationOutboxDB.delivered_on < before)))
+        self.session.commit()
+
+    @traced()
+    def record_transfer_stats(self, arr: ArrInstance, torrents: list[Torrent]) -> None:
+        """ Persist bytes, duration and average rate of each transferred torrent in one commit """
+        transferred = [torrent for torrent in torrents if torrent.transferred and torrent.transfer_seconds > 0]
+        if len(transferred) == 0:
+            return
+
+        database = self._table(arr)
+        stmt = update(database).where(and_(database.arr == arr.name, database.torrent_name == bindparam("b_torrent_name"))).values(
+            bytes_transferred = bindparam("b_bytes"),
+            transfer_seconds = bindparam("b_seconds"),
+            transfer_rate = bindparam("b_rate"))
+        self.session.execute(stmt, [dict(b_torrent_name = torrent.path,
+                                         b_bytes = torrent.bytes_transferred,
+                                         b_seconds = torrent.transfer_seconds,
+                                         b_rate = torrent.transfer_rate) for torrent in transferred])
+        self.session.commit()
+
+    @traced()
+    def record_progress(self, arr: ArrInstance, torrents: list[Torrent]) -> None:
+        """
+        Give the retry back to failed torrents that got further than any attempt before, only outright failures use up one of the 3 retries.
+        Progress has to beat the best attempt so far, a torrent cannot loop forever without getting closer
+        """
+        progressed = [torrent for torrent in torrents if not torrent.transferred and torrent.local_bytes > 0]
+        if len(progressed) == 0:
+            return
+
+        database = self._table(arr)
+        stmt = update(database).where(and_(database.arr == arr.name,
+                                           database.torrent_name == bindparam("b_torrent_name"),
+                                           database.import_complete == False,
+                                           or_(database.progress_bytes == None, database.progress_bytes < bindparam("b_bytes")))).values(
+            retries = case((database.retries > 0, database.retries - 1), else_ = 0),
+            progress_bytes = bindparam("b_bytes"))
+        self.session.execute(stmt, [dict(b_torrent_name = torrent.path, b_bytes = torrent.local_bytes) for torrent in progressed])
         self.session.commit()
+        self.logger.info("%s failed %s torrents with partial data, attempts that got further than before keep their retry: %s",
+                         arr.name, len(progressed), [torrent.path for torrent in progressed])
+
+    @traced()
+    def is_settled(self, arr: ArrInstance) -> bool:
+        """
+        Returns:
+            bool: nothing pending import, nothing left to purge, no transfer job still active and no notification waiting to be sent for arr.
+            Another run with an empty Arr queue would have nothing to do
+        """
+        database = self._table(arr)
+        unsettled = select(database.id).where(and_(database.arr == arr.name, or_(database.import_complete == False, database.purged == False))).limit(1)
+        if self.session.execute(unsettled).first() is not None:
+            return False
+        active = select(TransferJobDB.id).where(and_(TransferJobDB.arr == arr.name, TransferJobDB.state.in_(ACTIVE_STATES))).limit(1)
+        if self.session.execute(active).first() is not None:
+            return False
+        outbox = select(NotificationOutboxDB.id).where(and_(NotificationOutboxDB.arr == arr.name,
+                                                            NotificationOutboxDB.delivered_on.is_(None),
+                                                            NotificationOutboxDB.attempts < MAX_ATTEMPTS)).limit(1)
+        return self.session.execute(outbox).first() is None
+
+    @traced()
+    def recover_stale_transfers(self, arr: ArrInstance, lock_dir: str, owned: set[str]) -> None:
+        """
+        Active jobs nobody holds a transfer lock for anymore died with their run, close them out as abandoned.
+        Every job's lock is probed, a detached rsync keeps its lock even once the torrent left the Arr queue
+
+        Args:
+            owned(set[str]): torrent names whose transfer lock the caller holds, any active job of theirs is left from a dead run
+        """
+        stmt = select(TransferJobDB.id, TransferJobDB.torrent_name).where(and_(TransferJobDB.arr == arr.name, TransferJobDB.state.in_(ACTIVE_STATES)))
+        stale = [row.id for row in self.session.execute(stmt).all()
+                 if row.torrent_name in owned or not lock.transfer_lock(lock_dir, arr.name, row.torrent_name).is_held_elsewhere()]
+        if len(stale) == 0:
+            return
+
+        self.logger.info("Marking %s stale %s transfer jobs as abandoned.", len(stale), arr.name)
+        for chunk in self._chunks(stale):
+            self.session.execute(update(TransferJobDB).where(TransferJobDB.id.in_(chunk)).values(state = ABANDONED, finished_on = datetime.now()))
+        self.session.commit()
+
+    @traced()
+    def enqueue_transfers(self, arr: ArrInstance, torrents: list[Torrent], destination: str) -> None:
+        """ Persist a queued job per torrent, one executemany insert """
+        if len(torrents) == 0:
+            return
+
+        now = datetime.now()
+        self.session.execute(insert(TransferJobDB), [dict(arr = arr.name,
+                                                          torrent_name = torrent.path,
+                                                          source = torrent.full_path,
+                                                          destination = destination,
+                                                          state = QUEUED,
+                                                          enqueued_on = now) for torrent in torrents])
+        self.session.commit()
+
+    @traced()
+    def get_first_enqueued(self, arr: ArrInstance, torrent_names: list[str]) -> dict[str, datetime]:
+        """
+        Returns:
+            dict(str, datetime): when each torrent was first queued for transfer across all attempts, for starvation protection
+        """
+        first_enqueued = {}
+        for chunk in self._chunks(torrent_names):
+            stmt = select(TransferJobDB.torrent_name, func.min(TransferJobDB.enqueued_on).label("enqueued_on")).where(and_(TransferJobDB.arr == arr.name,
+                                                                                                                           TransferJobDB.torrent_name.in_(chunk))).group_by(TransferJobDB.torrent_name)
+            for row in self.session.execute(stmt).all():
+                if row.enqueued_on is not None:
+                    first_enqueued[row.torrent_name] = row.enqueued_on
+        return first_enqueued
+
+    @traced()
+    def start_transfers(self, arr: ArrInstance, torrents: list[Torrent]) -> None:
+        if len(torrents) == 0:
+            return
+
+        for chunk in self._chunks([torrent.path for torrent in torrents]):
+            stmt = update(TransferJobDB).where(and_(TransferJobDB.arr == arr.name, TransferJobDB.torrent_name.in_(chunk), TransferJobDB.state == QUEUED)).values(state = RUNNING, started_on = datetime.now())
+            self.session.execute(stmt)
+        self.session.commit()
+
+    @traced()
+    def finish_transfers(self, arr: ArrInstance, torrents: list[Torrent]) -> None:
+        """ Close out running jobs whose rsync exit code is known, detached transfers stay running """
+        finished = [torrent for torrent in torrents if torrent.exit_code is not None]
+        if len(finished) == 0:
+            return
+
+        stmt = update(TransferJobDB).where(and_(TransferJobDB.arr == arr.name,
+                                                TransferJobDB.torrent_name == bindparam("b_torrent_name"),
+                                                TransferJobDB.state == RUNNING)).values(
+            state = bindparam("b_state"),
+            exit_code = bindparam("b_exit_code"),
+            finished_on = bindparam("b_finished_on"))
+        now = datetime.now()
+        self.session.execute(stmt, [dict(b_torrent_name = torrent.path,
+                                         b_state = DONE if torrent.transferred else FAILED,
+                                         b_exit_code = torrent.exit_code,
+                                         b_finished_on = now) for torrent in finished])
+        self.session.commit()
+
+    @traced()
+    def record_detached_transfers(self, arr: ArrInstance, torrents: list[Torrent]) -> None:
+        """ Remember which process carries each detached transfer and where its output and exit status land """
+        detached = [torrent for torrent in torrents if torrent.detached]
+        if len(detached) == 0:
+            return
+
+        stmt = update(TransferJobDB).where(and_(TransferJobDB.arr == arr.name,
+                                                TransferJobDB.torrent_name == bindparam("b_torrent_name"),
+                                                TransferJobDB.state == RUNNING)).values(
+            pid = bindparam("b_pid"),
+            log_file = bindparam("b_log_file"),
+            status_file = bindparam("b_status_file"))
+        self.session.execute(stmt, [dict(b_torrent_name = torrent.path,
+                                         b_pid = torrent.pid,
+                                         b_log_file = torrent.log_file,
+                                         b_status_file = torrent.status_file) for torrent in detached])
+        self.session.commit()
+
+    @traced()
+    def get_detached_transfers(self, arr: ArrInstance) -> list[TransferJobDB]:
+        """ Running jobs handed to a detached rsync, oldest first """
+        stmt = select(TransferJobDB).where(and_(TransferJobDB.arr == arr.name,
+                                                TransferJobDB.state == RUNNING,
+                                                TransferJobDB.pid.is_not(None))).order_by(TransferJobDB.id)
+        return [TransferJobDB(**(result._asdict())) for result in self.session.execute(stmt).all()]
+
+    @traced()
+    def get_completed_transfers(self, arr: ArrInstance, torrent_names: list[str]) -> set[str]:
+        """
+        Returns:
+            set(str): torrent names whose latest transfer job finished with rsync exit code 0
+        """
+        latest = {}
+        for chunk in self._chunks(torrent_names):
+            stmt = select(TransferJobDB.torrent_name, TransferJobDB.state).where(and_(TransferJobDB.arr == arr.name,
+                                                                                     TransferJobDB.torrent_name.in_(chunk))).order_by(TransferJobDB.id)
+            for row in self.session.execute(stmt).all():
+                latest[row.torrent_name] = row.state
+        return set(torrent_name for (torrent_name, state) in latest.items() if state == DONE)
+
+    @traced()
+    def get_seedbox_listing(self, path: str) -> tuple[str, dict[str, tuple[bool, int | None, str]]]:
+        """
+        Returns:
+            tuple(str, dict): directory mtime and entries of the last listing of path, ("", {}) if never listed
+        """
+        listing = self.session.execute(select(SeedboxListingDB.mtime).where(SeedboxListingDB.path == path)).first()
+        if listing is None:
+            return ("", {})
+
+        stmt = select(SeedboxEntryDB.name, SeedboxEntryDB.is_dir, SeedboxEntryDB.size, SeedboxEntryDB.mtime).where(SeedboxEntryDB.path == path)
+        return (listing.mtime, {row.name: (row.is_dir, row.size, row.mtime) for row in self.session.execute(stmt).all()})
+
+    @traced()
+    def save_seedbox_listing(self, path: str, mtime: str, entries: dict[str, tuple[bool, int | None, str]]) -> None:
+        """ Replace the cached listing of path in one transaction """
+        self.session.execute(delete(SeedboxEntryDB).where(SeedboxEntryDB.path == path))
+        if len(entries) > 0:
+            self.session.execute(insert(SeedboxEntryDB), [dict(path = path,
+                                                              name = name,
+                                                              is_dir = is_dir,
+                                                              size = size,
+                                                              mtime = entry_mtime) for (name, (is_dir, size, entry_mtime)) in entries.items()])
+        stmt = insert(SeedboxListingDB).values(path = path, mtime = mtime, listed_on = datetime.now())
+        self.session.execute(stmt.on_conflict_do_update(index_elements = [SeedboxListingDB.path],
+                                                        set_ = dict(mtime = stmt.excluded.mtime, listed_on = stmt.excluded.listed_on)))
+        self.session.commit()
+
+    @traced()
+    def set_seedbox_sizes(self, path: str, sizes: dict[str, int]) -> None:
+        if len(sizes) == 0:
+            return
+
+        stmt = update(SeedboxEntryDB).where(and_(SeedboxEntryDB.path == path, SeedboxEntryDB.name == bindparam("b_name"))).values(size = bindparam("b_size"))
+        self.session.execute(stmt, [dict(b_name = name, b_size = size) for (name, size) in sizes.items()])
+        self.session.commit()
+
+    def _table(self, arr: ArrInstance):
+        """ Every instance of a kind shares its table, rows are told apart by the arr column """
+        return SonarrDB if arr.kind == SONARR else RadarrDB
+
+    def _get_torrents(self, arr: ArrInstance, torrent_names: list[str]) -> dict:
+        """ Load all rows of arr matching torrent_names, keyed by torrent_name """
+        database = self._table(arr)
+        rows = {}
+        for chunk in self._chunks(torrent_names):
+            stmt = select(database).where(and_(database.arr == arr.name, database.torrent_name.in_(chunk)))
+            for result in self.session.execute(stmt).all():
+                rows[result.torrent_name] = database(**(result._asdict()))
+        return rows
+
+    def _chunks(self, items: list[str]):
+        # Older sqlite builds cap bound parameters at 999 per statement
+        unique = list(dict.fromkeys(items))
+        for idx in range(0, len(unique), self.IN_CHUNK_SIZE):
+            yield unique[idx:idx + self.IN_CHUNK_SIZE]
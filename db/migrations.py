@@ -0,0 +1,96 @@
+# Versioned in-place schema migrations, tracked with sqlite "PRAGMA user_version".
+# Append new entries to the end, never edit or reorder a migration that has shipped.
+# Each entry is (version, description, statements) and runs in its own transaction.
+
+MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (1, "Unique torrent_name and purge scan index", [
+        # Unique index cannot be created while duplicates exist, keep the oldest row of each torrent
+        "DELETE FROM tbl_sonarr WHERE id NOT IN (SELECT MIN(id) FROM tbl_sonarr GROUP BY torrent_name)",
+        "DELETE FROM tbl_radarr WHERE id NOT IN (SELECT MIN(id) FROM tbl_radarr GROUP BY torrent_name)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_tbl_sonarr_torrent_name ON tbl_sonarr (torrent_name)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_tbl_radarr_torrent_name ON tbl_radarr (torrent_name)",
+        "CREATE INDEX IF NOT EXISTS ix_tbl_sonarr_import_complete_purged ON tbl_sonarr (import_complete, purged)",
+        "CREATE INDEX IF NOT EXISTS ix_tbl_radarr_import_complete_purged ON tbl_radarr (import_complete, purged)",
+    ]),
+    (2, "Per torrent transfer throughput", [
+        "ALTER TABLE tbl_sonarr ADD COLUMN bytes_transferred INTEGER",
+        "ALTER TABLE tbl_sonarr ADD COLUMN transfer_seconds FLOAT",
+        "ALTER TABLE tbl_sonarr ADD COLUMN transfer_rate FLOAT",
+        "ALTER TABLE tbl_radarr ADD COLUMN bytes_transferred INTEGER",
+        "ALTER TABLE tbl_radarr ADD COLUMN transfer_seconds FLOAT",
+        "ALTER TABLE tbl_radarr ADD COLUMN transfer_rate FLOAT",
+    ]),
+    (3, "Persistent transfer job queue", [
+        """CREATE TABLE IF NOT EXISTS tbl_transfer_job (
+            id INTEGER NOT NULL PRIMARY KEY,
+            arr VARCHAR NOT NULL,
+            torrent_name VARCHAR NOT NULL,
+            source VARCHAR,
+            destination VARCHAR,
+            state VARCHAR NOT NULL,
+            enqueued_on DATETIME,
+            started_on DATETIME,
+            finished_on DATETIME,
+            exit_code INTEGER
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_tbl_transfer_job_arr_state ON tbl_transfer_job (arr, state)",
+    ]),
+    (4, "Track detached transfer processes", [
+        "ALTER TABLE tbl_transfer_job ADD COLUMN pid INTEGER",
+        "ALTER TABLE tbl_transfer_job ADD COLUMN log_file VARCHAR",
+        "ALTER TABLE tbl_transfer_job ADD COLUMN status_file VARCHAR",
+    ]),
+    (5, "Cached seedbox listing", [
+        """CREATE TABLE IF NOT EXISTS tbl_seedbox_listing (
+            path VARCHAR NOT NULL PRIMARY KEY,
+            mtime VARCHAR NOT NULL,
+            listed_on DATETIME
+        )""",
+        """CREATE TABLE IF NOT EXISTS tbl_seedbox_entry (
+            path VARCHAR NOT NULL,
+            name VARCHAR NOT NULL,
+            is_dir BOOLEAN NOT NULL,
+            size INTEGER,
+            mtime VARCHAR,
+            PRIMARY KEY (path, name)
+        )""",
+    ]),
+    (6, "Resumable transfer progress", [
+        "ALTER TABLE tbl_sonarr ADD COLUMN progress_bytes INTEGER",
+        "ALTER TABLE tbl_radarr ADD COLUMN progress_bytes INTEGER",
+    ]),
+    (7, "Multiple Arr instances per table", [
+        # Existing rows belong to the single Sonarr/Radarr setup, whose instance names are the old path segments
+        "ALTER TABLE tbl_sonarr ADD COLUMN arr VARCHAR NOT NULL DEFAULT 'tv-sonarr'",
+        "ALTER TABLE tbl_radarr ADD COLUMN arr VARCHAR NOT NULL DEFAULT 'radarr'",
+        # Same torrent name can now exist once per instance
+        "DROP INDEX IF EXISTS ix_tbl_sonarr_torrent_name",
+        "DROP INDEX IF EXISTS ix_tbl_radarr_torrent_name",
+        "CREATE INDEX IF NOT EXISTS ix_tbl_sonarr_torrent_name ON tbl_sonarr (torrent_name)",
+        "CREATE INDEX IF NOT EXISTS ix_tbl_radarr_torrent_name ON tbl_radarr (torrent_name)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_tbl_sonarr_arr_torrent_name ON tbl_sonarr (arr, torrent_name)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_tbl_radarr_arr_torrent_name ON tbl_radarr (arr, torrent_name)",
+    ]),
+    (8, "Notification outbox", [
+        """CREATE TABLE IF NOT EXISTS tbl_notification_outbox (
+            id INTEGER NOT NULL PRIMARY KEY,
+            arr VARCHAR NOT NULL,
+            label VARCHAR NOT NULL,
+            torrent_name VARCHAR NOT NULL,
+            transferred BOOLEAN NOT NULL,
+            error VARCHAR,
+            enqueued_on DATETIME,
+            attempts INTEGER NOT NULL,
+            next_attempt_on DATETIME,
+            delivered_on DATETIME
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_tbl_notification_outbox_delivered_on ON tbl_notification_outbox (delivered_on)",
+    ]),
+    (9, "Transfer jobs by torrent", [
+        # Per torrent updates (start, detach, finish) otherwise scan every active job of the instance, once per torrent.
+        # state is part of it so the planner never prefers ix_tbl_transfer_job_arr_state for those
+        "CREATE INDEX IF NOT EXISTS ix_tbl_transfer_job_arr_torrent_name_state ON tbl_transfer_job (arr, torrent_name, state)",
+    ]),
+]
+
+LATEST_VERSION: int = MIGRATIONS[-1][0] if len(MIGRATIONS) > 0 else 0
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index
+from db.db_base import Base
+
+# Entries that failed this many sends are kept for inspection but no longer sent
+MAX_ATTEMPTS = 10
+
+class NotificationOutboxDB(Base):
+    __tablename__ = "tbl_notification_outbox"
+    # Keep in sync with db/migrations.py so fresh and migrated databases end up with the same schema
+    __table_args__ = (Index("ix_tbl_notification_outbox_delivered_on", "delivered_on"),)
+
+    id = Column(Integer, primary_key=True)
+    # Arr instance name, and its display name at the time the torrent finished
+    arr = Column(String, nullable=False)
+    label = Column(String, nullable=False)
+    torrent_name = Column(String, nullable=False)
+    transferred = Column(Boolean, nullable=False, default=False)
+    error = Column(String, nullable=True)
+    enqueued_on = Column(DateTime, nullable=True)
+    # Failed sends so far, a Retry-After or backoff holds the entry back until next_attempt_on
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_on = Column(DateTime, nullable=True)
+    delivered_on = Column(DateTime, nullable=True)
+
+    def __init__(self, id: int, arr: str, label: str, torrent_name: str, transferred: bool = False, error: str | None = None, enqueued_on: str | None = None, attempts: int = 0, next_attempt_on: str | None = None, delivered_on: str | None = None):
+        self.id = id
+        self.arr = arr
+        self.label = label
+        self.torrent_name = torrent_name
+        self.transferred = transferred
+        self.error = error
+        self.enqueued_on = enqueued_on
+        self.attempts = attempts
+        self.next_attempt_on = next_attempt_on
+        self.delivered_on = delivered_on
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Boolean
+from db.db_base import Base
+
+class SeedboxEntryDB(Base):
+    __tablename__ = "tbl_seedbox_entry"
+
+    path = Column(String, primary_key=True)
+    name = Column(String, primary_key=True)
+    is_dir = Column(Boolean, nullable=False, default=False)
+    # Apparent size in bytes. Directories stay NULL until du is run on them
+    size = Column(Integer, nullable=True)
+    mtime = Column(String, nullable=True)
+
+    def __init__(self, path: str, name: str, is_dir: bool = False, size: int | None = None, mtime: str | None = None):
+        self.path = path
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
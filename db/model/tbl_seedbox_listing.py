@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, DateTime
+from db.db_base import Base
+
+class SeedboxListingDB(Base):
+    __tablename__ = "tbl_seedbox_listing"
+
+    # Seedbox directory, e.g. SEEDBOX_SONARR_TORRENT_PATH
+    path = Column(String, primary_key=True)
+    # find %T@ of the directory when it was last listed, kept as text so it compares exactly
+    mtime = Column(String, nullable=False)
+    listed_on = Column(DateTime, nullable=True)
+
+    def __init__(self, path: str, mtime: str, listed_on: str | None = None):
+        self.path = path
+        self.mtime = mtime
+        self.listed_on = listed_on
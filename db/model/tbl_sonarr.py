@@ -1,19 +1,29 @@
-from sqlalchemy import Column, Date, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Date, Integer, String, Boolean, DateTime, Index, Float
 from db.db_base import Base
 
 class SonarrDB(Base):
     __tablename__ = "tbl_sonarr"
+    # Keep in sync with db/migrations.py so fresh and migrated databases end up with the same schema
+    __table_args__ = (Index("ix_tbl_sonarr_import_complete_purged", "import_complete", "purged"),
+                      Index("ix_tbl_sonarr_arr_torrent_name", "arr", "torrent_name", unique=True))
 
     id = Column(Integer, primary_key=True)
-    torrent_name = Column(String, nullable=False)
+    torrent_name = Column(String, nullable=False, index=True)
     retries = Column(Integer, nullable=False, default=1)
     import_complete = Column(Boolean, nullable=False, default=False)
     notified = Column(Boolean, nullable=False, default=False)
     completed_on = Column(DateTime, nullable=True)
     purged = Column(Boolean, nullable=False, default=False)
     is_dir = Column(Boolean, nullable=False, default=False)
+    bytes_transferred = Column(Integer, nullable=True)
+    transfer_seconds = Column(Float, nullable=True)
+    transfer_rate = Column(Float, nullable=True)
+    # Most bytes ever seen locally for an unfinished transfer, a failed attempt only keeps its retry when it beats this
+    progress_bytes = Column(Integer, nullable=True)
+    # ArrInstance.name, rows from before multiple instances belong to "tv-sonarr"
+    arr = Column(String, nullable=False, default="tv-sonarr")
 
-    def __init__(self, id:int, torrent_name: str, retries: int = 1, import_complete: bool = False, notified: bool = False, completed_on: str | None = None, purged: bool = False, is_dir: bool = False):
+    def __init__(self, id:int, torrent_name: str, retries: int = 1, import_complete: bool = False, notified: bool = False, completed_on: str | None = None, purged: bool = False, is_dir: bool = False, bytes_transferred: int | None = None, transfer_seconds: float | None = None, transfer_rate: float | None = None, progress_bytes: int | None = None, arr: str = "tv-sonarr"):
         self.id = id
         self.torrent_name = torrent_name
         self.retries = retries
@@ -22,3 +32,8 @@ class SonarrDB(Base):
         self.completed_on = completed_on
         self.purged = purged
         self.is_dir = is_dir
+        self.bytes_transferred = bytes_transferred
+        self.transfer_seconds = transfer_seconds
+        self.transfer_rate = transfer_rate
+        self.progress_bytes = progress_bytes
+        self.arr = arr
@@ -0,0 +1,46 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from db.db_base import Base
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ABANDONED = "abandoned"
+ACTIVE_STATES = [QUEUED, RUNNING]
+
+class TransferJobDB(Base):
+    __tablename__ = "tbl_transfer_job"
+    # Keep in sync with db/migrations.py so fresh and migrated databases end up with the same schema
+    __table_args__ = (Index("ix_tbl_transfer_job_arr_state", "arr", "state"),
+                      Index("ix_tbl_transfer_job_arr_torrent_name_state", "arr", "torrent_name", "state"))
+
+    id = Column(Integer, primary_key=True)
+    arr = Column(String, nullable=False)
+    torrent_name = Column(String, nullable=False)
+    source = Column(String, nullable=True)
+    destination = Column(String, nullable=True)
+    state = Column(String, nullable=False, default=QUEUED)
+    enqueued_on = Column(DateTime, nullable=True)
+    started_on = Column(DateTime, nullable=True)
+    finished_on = Column(DateTime, nullable=True)
+    exit_code = Column(Integer, nullable=True)
+    # Detached (background) transfers only
+    pid = Column(Integer, nullable=True)
+    log_file = Column(String, nullable=True)
+    status_file = Column(String, nullable=True)
+
+    def __init__(self, id:int, arr: str, torrent_name: str, source: str | None = None, destination: str | None = None, state: str = QUEUED, enqueued_on: str | None = None, started_on: str | None = None, finished_on: str | None = None, exit_code: int | None = None, pid: int | None = None, log_file: str | None = None, status_file: str | None = None):
+        self.id = id
+        self.arr = arr
+        self.torrent_name = torrent_name
+        self.source = source
+        self.destination = destination
+        self.state = state
+        self.enqueued_on = enqueued_on
+        self.started_on = started_on
+        self.finished_on = finished_on
+        self.exit_code = exit_code
+        self.pid = pid
+        self.log_file = log_file
+        self.status_file = status_file
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+class Span:
+    def __init__(self, name: str, attrs: dict | None = None) -> None:
+        self.name = name
+        self.attrs = attrs if attrs else {}
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.children: list["Span"] = []
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "thread": self.thread,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attrs": self.attrs,
+            "children": [child.to_dict() for child in self.children]
+        }
+
+class Tracer:
+    """
+        Per run timing tree. Disabled tracer cost one attribute check per span.
+        Spans nest per thread, a span opened in a worker thread with nothing above it hangs off the run root.
+    """
+    def __init__(self) -> None:
+        self.enabled = False
+        self.root = Span("run")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self.enabled = True
+        self.root = Span("run")
+
+    def _stack(self) -> list[Span]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+
+        stack = self._stack()
+        parent = stack[-1] if len(stack) > 0 else self.root
+        current = Span(name, attrs)
+        with self._lock:
+            parent.children.append(current)
+        stack.append(current)
+        try:
+            yield
+        finally:
+            current.duration = time.perf_counter() - current.start
+            stack.pop()
+
+    def traced(self, name: str = "") -> Callable:
+        """ Decorator version of span, defaults to the function qualified name """
+        def decorator(func: Callable) -> Callable:
+            span_name = name if name else func.__qualname__
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def finish(self) -> Span:
+        self.root.duration = time.perf_counter() - self.root.start
+        return self.root
+
+    def render(self) -> str:
+        lines = []
+        def walk(span: Span, depth: int) -> None:
+            thread = "" if span.thread == "MainThread" else f" [{span.thread}]"
+            attrs = "" if len(span.attrs) == 0 else " " + " ".join(f"{key}={value}" for (key, value) in span.attrs.items())
+            lines.append(f"{'  ' * depth}{span.name}{thread}: {span.duration * 1000:.1f} ms{attrs}")
+            for child in span.children:
+                walk(child, depth + 1)
+        walk(self.root, 0)
+        return "\n".join(lines)
+
+    def report(self, output: str, json_path: str) -> None:
+        """
+        Args:
+            output(str): "log" to log the tree at info level, "json" to write it to json_path
+        """
+        self.finish()
+        if output == "json":
+            with open(json_path, "w", encoding = "utf-8") as file:
+                json.dump(self.root.to_dict(), file, indent = 2)
+        else:
+            # Log at the configured level so the tree shows up regardless of VERBOSE
+            logging.getLogger(__name__).log(logging.getLogger().getEffectiveLevel(), "Run timing tree:\n%s", self.render())
+
+# Shared by every module, enabled by main when TRACE is set
+TRACER = Tracer()
+span = TRACER.span
+traced = TRACER.traced
+
+LOG_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def run_profiled(mode: str, func: Callable, *args, **kwargs) -> None:
+    """
+    Run func under cProfile or tracemalloc and write the report next to log/app.log
+
+    Args:
+        mode(str): "cprofile" or "tracemalloc", anything else just runs func
+    """
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    if mode == "cprofile":
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(func, *args, **kwargs)
+        finally:
+            profiler.dump_stats(os.path.join(LOG_DIR, f"profile-{stamp}.prof"))
+            with open(os.path.join(LOG_DIR, f"profile-{stamp}.txt"), "w", encoding = "utf-8") as file:
+                pstats.Stats(profiler, stream = file).sort_stats("cumulative").print_stats(50)
+    elif mode == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start(25)
+        try:
+            func(*args, **kwargs)
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            (current, peak) = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(os.path.join(LOG_DIR, f"tracemalloc-{stamp}.txt"), "w", encoding = "utf-8") as file:
+                file.write(f"Current: {current / 1024:.1f} KiB Peak: {peak / 1024:.1f} KiB\n\n")
+                for stat in snapshot.statistics("lineno")[:50]:
+                    file.write(f"{stat}\n")
+    else:
+        func(*args, **kwargs)
@@ -1,12 +1,452 @@
 import os
-from api import Arr
-from ssh import ssh
-from db import db, db_queries
-from cli import rsync, notification, permission
+import argparse
+import importlib
+import signal
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from api import Arr, http_client
+from cli import lock, notification, scheduler
 import config
 from log.log import Log
+from log.trace import TRACER, LOG_DIR, run_profiled
+from metrics.metrics import Metrics
+from model.arr_instance import ArrInstance, ARR, SONARR, RADARR
+from model.path_index import PathIndex
 from model.torrent import Torrent
 import shutil
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    # paramiko, SQLAlchemy and psutil cost more than a whole idle run, stages import what they use when they run
+    import sqlalchemy
+    from api import webhook
+    from ssh import ssh
+    from db import db_queries
+    from cli import purge
+
+class Resources:
+    """
+        DB engine, SSH transport, pooled HTTP client, purge worker pool and transfer scheduler.
+        One-shot run build and close them once, daemon mode keep them warm across cycles.
+        DB, SSH and purge pool are only built on first use, a run that stops after the Arr queue check never pays for them
+    """
+    def __init__(self, logger:Log) -> None:
+        self.logger = logger
+        # Pipelines run in parallel, only one of them may build each resource
+        self._build_lock = threading.Lock()
+        self._db_engine:"sqlalchemy.Engine | None" = None
+        self._ssh_conn:"ssh.SSH | None" = None
+        self._purge_worker:"purge.Purge | None" = None
+        # Arr and notification calls share one connection pool
+        self.http = http_client.HttpClient(logger, retries = config.HTTP_RETRIES)
+        self.arr_service = Arr.Arr(logger = logger, http = self.http, full_validation = config.ARR_FULL_VALIDATION)
+        self.arr_instances = get_arr_instances(logger)
+        # Shared by every Arr pipeline, splits TRANSFER_SLOTS fairly between Arrs that have work
+        self.scheduler = scheduler.Scheduler(logger, config.TRANSFER_SLOTS, config.TRANSFER_MAX_WAIT)
+        # Detached rsync outlive the run and cannot wait for a slot, each instance gets a fixed share of TRANSFER_SLOTS (at least one)
+        instances = max(1, len(self.arr_instances))
+        self.detached_workers = max(1, config.TRANSFER_SLOTS // instances) if config.TRANSFER_SLOTS > 0 else 0
+        # rsync --bwlimit is per process, split the global limit across every stream that can run at once.
+        # With slots that is TRANSFER_SLOTS, or one detached stream per instance when there are fewer slots than instances
+        max_streams = max(config.TRANSFER_SLOTS, instances) if config.TRANSFER_SLOTS > 0 else config.RSYNC_WORKERS * instances
+        self.stream_bwlimit = max(1, config.TRANSFER_BWLIMIT // max_streams) if config.TRANSFER_BWLIMIT > 0 else 0
+
+    @property
+    def db_engine(self) -> "sqlalchemy.Engine":
+        with self._build_lock:
+            if self._db_engine is None:
+                from db import db
+                # Create tables once, pipelines only open connections on it
+                self._db_engine = db.DB(self.logger, config.DB_PATH, config.DB_VERBOSE).get_engine()
+            return self._db_engine
+
+    @property
+    def ssh_conn(self) -> "ssh.SSH":
+        with self._build_lock:
+            if self._ssh_conn is None:
+                from ssh import ssh
+                self._ssh_conn = ssh.SSH(logger = self.logger,
+                                         host = config.SEEDBOX_ENDPOINT,
+                                         port = config.SEEDBOX_PORT,
+                                         username = config.SEEDBOX_USERNAME,
+                                         control_path = config.SEEDBOX_CONTROL_PATH)
+            return self._ssh_conn
+
+    @property
+    def purge_worker(self) -> "purge.Purge":
+        with self._build_lock:
+            if self._purge_worker is None:
+                from cli import purge
+                self._purge_worker = purge.Purge(self.logger, config.PURGE_WORKERS)
+            return self._purge_worker
+
+    def close(self) -> None:
+        if self._purge_worker is not None:
+            self._purge_worker.close()
+        if self._ssh_conn is not None:
+            self._ssh_conn.close()
+        self.http.close()
+        if self._db_engine is not None:
+            self._db_engine.dispose()
+
+def arr_pipeline(logger:Log, metrics:Metrics, resources:Resources, arr:ArrInstance) -> tuple[list[Torrent], int]:
+    """
+    Run one Arr instance end to end: fetch -> list -> reconcile -> transfer -> permission.
+    Instances do not depend on each other until the final notification, so this is safe to run in parallel.
+
+    Args:
+        arr(ArrInstance): Instance to sync, its name keys DB rows, locks and metrics
+
+    Returns:
+        tuple(list[Torrent], int): torrents that need a notification (each carrying its own transfer result), number of torrents still pending import
+    """
+    arr_label = arr.label
+    arr_metric = arr.label.lower()
+    seedbox_path = arr.seedbox_path
+    dest_dir = arr.dest_dir
+    arr_service = resources.arr_service
+
+    # These queue should represent the torrents file name, not display name (they can be different such that file name might delimit by . but display name delimit by space)
+    with metrics.stage("arr_fetch", arr_metric):
+        api_queue:list[Torrent] = arr_service.get_api_queue(arr)
+    metrics.set("queue_size", len(api_queue), arr = arr_metric)
+
+    # Most runs end here: nothing to import and the last full run left nothing to reconcile, purge or reap.
+    # Stop before the DB, seedbox and rsync stages are even imported
+    if len(api_queue) == 0 and os.path.exists(lock.idle_marker(config.LOCK_DIR, arr.name)):
+        logger.info("%s queue is empty and nothing is left from earlier runs, skipping.", arr_label)
+        metrics.set("pending_import", 0, arr = arr_metric)
+        return ([], 0)
+
+    from db import db_queries
+    from cli import rsync, permission, transfer_job
+    ssh_conn = resources.ssh_conn
+
+    # Each pipeline get its own connection, sqlite connection cannot be shared across threads.
+    # Closed on every exit path, daemon mode keeps the engine and its pool across cycles
+    with db_queries.DB_Query(logger, resources.db_engine) as db_query:
+        # These are imports pending in Arr and exists in seedbox, filtering so only remote seedbox torrent are included.
+        # Listing is cached in the DB and only refreshed when the seedbox directory mtime changes
+        with metrics.stage("seedbox_list", arr_metric):
+            pending_import = ssh_conn.filter_seedbox_against_api(arr, api_queue, db_query)
+        logger.info("%s pending import exists in Seedbox: %s", arr_label, pending_import)
+        metrics.set("pending_import", len(pending_import), arr = arr_metric)
+
+        # Torrents still in flight (another run, or a detached rsync) are left alone, no retry counted for them
+        transfer_locks:dict[str, lock.FileLock] = {}
+        in_flight:set[str] = set()
+        for torrent in pending_import:
+            if torrent.path in transfer_locks or torrent.path in in_flight:
+                continue
+            transfer_lock = lock.transfer_lock(config.LOCK_DIR, arr.name, torrent.path)
+            if transfer_lock.acquire():
+                transfer_locks[torrent.path] = transfer_lock
+            else:
+                in_flight.add(torrent.path)
+        if len(in_flight) > 0:
+            logger.info("%s torrents already in flight, skipping: %s", arr_label, in_flight)
+
+        purge_jobs = []
+        purge_guard = None
+        seedbox_torrent:list[Torrent] = []
+        reaped:list[Torrent] = []
+        try:
+            # Reconciliation is short, wait for another run to finish its own instead of skipping
+            with lock.arr_lock(config.LOCK_DIR, arr.name):
+                # Whatever this run enqueues, a later run must not skip it on the marker of an older idle run
+                set_idle(arr, False)
+
+                # Detached rsync from earlier runs that exited since, their real outcome goes out with this run's notification
+                with metrics.stage("reap", arr_metric):
+                    transfer_jobs = transfer_job.TransferJobs(logger, config.LOCK_DIR)
+                    reaped = transfer_jobs.reap(db_query, arr, set(transfer_locks))
+                    # Before check_torrents, so a detached attempt that made progress already got its retry back
+                    settle_transfers(logger, ssh_conn, db_query, arr, reaped)
+                    transfer_jobs.cleanup(reaped)
+
+                # Mark torrent name not in API result list as complete.
+                # It either finish transfer or user cancel the import job in Activity Tab
+                with metrics.stage("db_reconcile", arr_metric):
+                    db_query.mark_db_complete(pending_import, arr)
+
+                # If it does not exists in API anymore, it means the import is complete.
+                # Deletion runs in background while we transfer, DB is only flagged for what actually got removed
+                purge_guard = lock.purge_lock(config.LOCK_DIR, arr.name)
+                if purge_guard.acquire():
+                    with metrics.stage("purge", arr_metric):
+                        purge_candidates = db_query.get_purge_candidates(arr)
+                        logger.info("Purging %s items from %s local directory.", len(purge_candidates), arr_label)
+                        purge_jobs = resources.purge_worker.submit(dest_dir, purge_candidates)
+                else:
+                    logger.info("Another run is purging %s, skipping purge.", arr_label)
+                    purge_guard = None
+
+                # Check against database if the torrent already tried import. Try a max of 3 times before giving up and send Discord message
+                # Only return list of full path seedbox torrents not in database (aka. new torrents)
+                with metrics.stage("db_reconcile", arr_metric):
+                    db_query.recover_stale_transfers(arr, config.LOCK_DIR, set(transfer_locks))
+                    # Last transfer exited 0 and the files are still here, Arr just has not imported yet. Do not burn a retry on it
+                    completed = set(torrent_name for torrent_name in db_query.get_completed_transfers(arr, list(transfer_locks))
+                                    if os.path.exists(os.path.join(dest_dir, torrent_name)))
+                    seedbox_torrent = db_query.check_torrents_and_get_full_path([torrent for torrent in pending_import if torrent.path in transfer_locks and torrent.path not in completed], seedbox_path, arr)
+                    db_query.enqueue_transfers(arr, seedbox_torrent, dest_dir)
+
+                # Smallest first so Arr can start importing sooner, anything queued for too long goes ahead of them
+                with metrics.stage("schedule", arr_metric):
+                    seedbox_torrent = resources.scheduler.order(seedbox_torrent, db_query.get_first_enqueued(arr, [torrent.path for torrent in seedbox_torrent]))
+
+            for torrent in seedbox_torrent:
+                torrent.lock_fd = transfer_locks[torrent.path].fd
+
+            if len(seedbox_torrent) > 0:
+                with metrics.stage("rsync", arr_metric), resources.scheduler.demand(arr.name):
+                    db_query.start_transfers(arr, seedbox_torrent)
+                    rsync.Rsync(logger,
+                                config.RSYNC_WORKERS,
+                                config.RSYNC_PROGRESS_INTERVAL,
+                                chown = f"{config.CHOWN_UID}:{config.CHOWN_GID}" if config.RSYNC_APPLY_PERMISSION and config.CHOWN_UID and config.CHOWN_GID else "",
+                                chmod = config.CHMOD if config.RSYNC_APPLY_PERMISSION else "",
+                                job_dir = config.TRANSFER_LOG_DIR,
+                                slot = lambda: resources.scheduler.slot(arr.name),
+                                bwlimit = resources.stream_bwlimit,
+                            detached_workers = resources.detached_workers).transfer_from_remote(
+                        user = config.SEEDBOX_USERNAME,
+                        seedbox_endpoint = config.SEEDBOX_ENDPOINT,
+                        port = config.SEEDBOX_PORT,
+                        sources = seedbox_torrent,
+                        destination = dest_dir,
+                        arr_name = arr.name,
+                        ssh_command = ssh_conn.get_rsync_shell())
+                    settle_transfers(logger, ssh_conn, db_query, arr, seedbox_torrent)
+                    db_query.record_detached_transfers(arr, seedbox_torrent)
+                db_query.record_transfer_stats(arr, seedbox_torrent)
+            else:
+                logger.info("No %s torrents to transfer.", arr_label)
+        except BaseException:
+            # Purge already submitted finishes in the worker pool, the next run flags what it removed
+            if purge_guard is not None:
+                purge_guard.release()
+            raise
+        finally:
+            # Detached rsync inherited its own copy of the lock and keeps the torrent in flight until it exits
+            for transfer_lock in transfer_locks.values():
+                transfer_lock.release()
+            for torrent in seedbox_torrent:
+                torrent.lock_fd = None
+
+        # Detached torrents count once reaped, the run that started them does not know their outcome yet
+        finished = [torrent for torrent in seedbox_torrent if not torrent.detached] + reaped
+        metrics.set("items_transferred", len([torrent for torrent in finished if torrent.transferred]), arr = arr_metric)
+        metrics.set("items_failed", len([torrent for torrent in finished if not torrent.transferred]), arr = arr_metric)
+        metrics.set("items_detached", len([torrent for torrent in seedbox_torrent if torrent.detached]), arr = arr_metric)
+        metrics.set("bytes_transferred", sum(torrent.bytes_transferred for torrent in seedbox_torrent), arr = arr_metric)
+        for torrent in finished:
+            if torrent.exit_code is not None:
+                metrics.inc("rsync_exit_code", arr = arr_metric, code = str(torrent.exit_code))
+
+        # Failed torrents never landed locally, nothing to fix up. Rsync already applied them with RSYNC_APPLY_PERMISSION
+        with metrics.stage("permissions", arr_metric):
+            if not config.RSYNC_APPLY_PERMISSION:
+                permission.Permission(config.PERMISSION_WORKERS).update_permission(dest_dir, [torrent for torrent in finished if torrent.transferred], config.CHOWN_UID, config.CHOWN_GID, config.CHMOD)
+
+        if purge_guard is not None:
+            try:
+                with metrics.stage("purge", arr_metric):
+                    (purged, failed_purge) = resources.purge_worker.wait(purge_jobs)
+                    db_query.mark_purged(arr, purged)
+            finally:
+                purge_guard.release()
+            metrics.set("items_purged", len(purged), arr = arr_metric)
+            if len(failed_purge) > 0:
+                logger.error("Failed to purge %s %s items, retrying next run: %s", len(failed_purge), arr_label, failed_purge)
+
+        # Only notify ones that has not been notified. Dont want to spam Discord
+        # Reaped torrents were held back when detached, they are notified now with their real outcome
+        need_notify = [torrent for torrent in seedbox_torrent if not torrent.notified and not torrent.detached] + reaped
+        # Queued in the same commit, delivered once every instance is done
+        db_query.set_notified(arr, need_notify, outbox = notification_service() is not None)
+
+        # Under arr_lock, so a run that enqueued in the meantime is seen here or clears the marker after us
+        with lock.arr_lock(config.LOCK_DIR, arr.name):
+            set_idle(arr, db_query.is_settled(arr))
+
+        return (need_notify, len(pending_import))
+
+def set_idle(arr:ArrInstance, idle:bool) -> None:
+    """ Create or remove the idle marker of arr, caller holds its arr_lock """
+    marker = lock.idle_marker(config.LOCK_DIR, arr.name)
+    if idle:
+        os.makedirs(os.path.dirname(marker), exist_ok = True)
+        open(marker, "w").close()
+    elif os.path.exists(marker):
+        os.remove(marker)
+
+def settle_transfers(logger:Log, ssh_conn:"ssh.SSH", db_query:"db_queries.DB_Query", arr:ArrInstance, torrents:list[Torrent]) -> None:
+    """
+    Confirm finished transfers against the seedbox manifest, then persist each job outcome and resume progress.
+    Detached torrents are skipped, they are settled once reaped.
+    """
+    finished = [torrent for torrent in torrents if not torrent.detached]
+    if len(finished) == 0:
+        return
+
+    from cli import manifest
+    remote = ssh_conn.get_manifest(arr.seedbox_path, [torrent.path for torrent in finished if torrent.transferred])
+    # No manifest either means removed from the seedbox or find failed on it, only a listing tells them apart
+    gone = ssh_conn.get_gone(arr.seedbox_path, [torrent.path for torrent in finished if torrent.transferred and torrent.path not in remote])
+    manifest.Manifest(logger).verify(remote, arr.dest_dir, finished, gone)
+    db_query.finish_transfers(arr, finished)
+    db_query.record_progress(arr, finished)
+
+def get_arr_instances(logger:Log) -> list[ArrInstance]:
+    """
+    Returns:
+        list(ArrInstance): Every configured Arr instance, the single SONARR_*/RADARR_* setup when ARR_INSTANCES is not set
+    """
+    if len(config.ARR_INSTANCES) == 0:
+        # Names and categories are the old path segments, DB rows, transfer jobs and locks from before carry over
+        return [
+            ArrInstance("tv-sonarr", SONARR, config.SONARR_ENDPOINT, config.SONARR_API_KEY, config.SEEDBOX_SONARR_TORRENT_PATH, config.SONARR_DEST_DIR, category = "tv-sonarr", label = "Sonarr"),
+            ArrInstance("radarr", RADARR, config.RADARR_ENDPOINT, config.RADARR_API_KEY, config.SEEDBOX_RADARR_TORRENT_PATH, config.RADARR_DEST_DIR, category = "radarr", label = "Radarr"),
+        ]
+
+    instances:list[ArrInstance] = []
+    for entry in config.ARR_INSTANCES:
+        # Type can be left out when the name says it, e.g. "sonarr-4k"
+        kind = entry["type"].lower() or next((kind.value for kind in ARR if kind.value in entry["name"].lower()), "")
+        if kind not in [kind.value for kind in ARR]:
+            logger.error("Arr instance %s has no valid type (sonarr or radarr), skipping it.", entry["name"])
+            continue
+        instances.append(ArrInstance(entry["name"], ARR(kind), entry["endpoint"], entry["api_key"], entry["seedbox_path"], entry["dest_dir"], category = entry["category"]))
+    return instances
+
+def traced_pipeline(logger:Log, metrics:Metrics, resources:Resources, arr:ArrInstance) -> tuple[list[Torrent], int]:
+    with TRACER.span(f"pipeline.{arr.label.lower()}"):
+        return arr_pipeline(logger, metrics, resources, arr)
+
+def run(logger:Log, metrics:Metrics, resources:Resources) -> int:
+    """
+    Returns:
+        int: torrents still pending import across all Arr instances, daemon mode poll faster while this is not 0
+    """
+    arr_instances = resources.arr_instances
+
+    if config.CONCURRENT:
+        # Wall time is the slowest chain instead of their sum, only join for notification.
+        # Transport, DB and scheduler are shared, TRANSFER_SLOTS and TRANSFER_BWLIMIT hold across every instance
+        with ThreadPoolExecutor(max_workers = max(1, len(arr_instances))) as executor:
+            futures = [executor.submit(traced_pipeline, logger, metrics, resources, arr) for arr in arr_instances]
+            results = [future.result() for future in futures]
+    else:
+        results = [traced_pipeline(logger, metrics, resources, arr) for arr in arr_instances]
+    pending = sum(pending_count for (_, pending_count) in results)
+
+    notify_transfers(logger, metrics, resources, [(arr.label, need_notify) for (arr, (need_notify, _)) in zip(arr_instances, results)])
+    return pending
+
+def notify_transfers(logger:Log, metrics:Metrics, resources:Resources, arr_results:list[tuple[str, list[Torrent]]]) -> None:
+    """ Log what this run transferred, then deliver every queued notification: this run's and whatever an earlier run could not send """
+    if all(len(need_notify) == 0 for (_, need_notify) in arr_results):
+        logger.info("No new torrents to transfer.")
+
+    for (arr_label, need_notify) in arr_results:
+        transferred = [torrent for torrent in need_notify if torrent.transferred]
+        failed = [torrent for torrent in need_notify if not torrent.transferred]
+
+        if len(transferred) > 0:
+            logger.info(f"Transferred {len(transferred)} new {arr_label} torrents.")
+        if len(failed) > 0:
+            logger.error(f"Transferred failed for {len(failed)} {arr_label} torrents.")
+
+    # An idle Arr has nothing left in the outbox, a run where every one is idle stays off the DB
+    if all(os.path.exists(lock.idle_marker(config.LOCK_DIR, arr.name)) for arr in resources.arr_instances):
+        return
+
+    from cli import outbox
+    from db import db_queries
+    service = notification_service()
+    with db_queries.DB_Query(logger, resources.db_engine) as db_query:
+        if service is None:
+            # Queued while notifications were still set up, they would keep every Arr from going idle
+            dropped = db_query.drop_pending_notifications()
+            if dropped > 0:
+                logger.info("Notifications are disabled, dropped %s undelivered.", dropped)
+            return
+
+        with metrics.stage("notify"):
+            outbox.Outbox(logger, notification.Notification(logger, config.WEBHOOK_URL, service, resources.http), config.LOCK_DIR).deliver(db_query)
+
+def notification_service() -> notification.NOTIFICATION | None:
+    """ Configured notification service, None when notifications are disabled """
+    if not config.WEBHOOK_URL or not config.NOTIFICATION_SERVICE:
+        return None
+    if config.NOTIFICATION_SERVICE.lower() == "apprise":
+        return notification.APPRISE
+    if config.NOTIFICATION_SERVICE.lower() == "discord":
+        return notification.DISCORD
+    return None
+
+def handle_webhook_event(logger:Log, resources:Resources, event:"webhook.WebhookEvent") -> None:
+    """
+    Import (Download): mark that release complete and purge it, once Arr has nothing left in its queue for the release.
+    Grab has nothing to sync yet (the download only just started), daemon goes back to tight polling for it instead.
+    Anything that cannot be resolved here is left for the next polling cycle.
+    """
+    arr = next((arr for arr in resources.arr_instances if arr.name == event.arr_name), None)
+    if arr is None or not event.download_id:
+        return
+
+    if event.event_type == "Download":
+        # Season pack fire one import event per episode, only purge when the whole release left the queue
+        if event.download_id in resources.arr_service.get_queue_download_ids(arr):
+            logger.info("%s release %s still has files pending import, purge later.", arr.label, event.download_id)
+            return
+        from db import db_queries
+        with db_queries.DB_Query(logger, resources.db_engine) as db_query:
+            # Same resolution as the queue side, against the seedbox listing the last run cached
+            (_, entries) = db_query.get_seedbox_listing(arr.seedbox_path)
+            torrent_names = event.torrent_names(arr, PathIndex.from_entries(entries),
+                                                lambda folder: db_query.get_seedbox_listing(os.path.join(arr.seedbox_path, folder))[1])
+            if len(torrent_names) == 0:
+                logger.info("%s import %s not found in seedbox listing, polling will pick it up: %s", arr.label, event.download_id, event.paths)
+            with lock.arr_lock(config.LOCK_DIR, arr.name):
+                db_query.mark_complete(torrent_names, arr)
+            with lock.purge_lock(config.LOCK_DIR, arr.name):
+                db_query.purge_local_complete_content(arr.dest_dir, arr, resources.purge_worker)
+
+def run_cycle(logger:Log, resources:Resources) -> int:
+    """ One run with metrics and tracing around it, shared by one-shot and daemon mode """
+    metrics = Metrics()
+    if config.TRACE:
+        TRACER.start()
+
+    def record_http(method:str, url:str, status:int | None, seconds:float) -> None:
+        host = urlparse(url).netloc
+        metrics.inc("http_requests", host = host, status = str(status) if status is not None else "error")
+        metrics.inc("http_request_seconds", seconds, host = host)
+
+    # Client outlives the cycle in daemon mode, only this cycle's requests go into its metrics
+    resources.http.hooks.append(record_http)
+    success = False
+    try:
+        pending = run(logger, metrics, resources)
+        success = True
+        return pending
+    finally:
+        resources.http.hooks.remove(record_http)
+        # Exported on every exit path, a failed run still updates run_success and timestamps
+        if config.METRICS_TEXTFILE:
+            try:
+                metrics.write(config.METRICS_TEXTFILE, success)
+            except OSError as e:
+                logger.error("Failed to write metrics textfile %s: %s", config.METRICS_TEXTFILE, e)
+        # Without a textfile nothing else detaches its log counter, daemon mode would add one per cycle
+        metrics.close()
+        if config.TRACE:
+            TRACER.report(config.TRACE, os.path.join(LOG_DIR, "trace.json"))
 
 def main(logger:Log) -> None:
     # Get a copy of production db
@@ -15,115 +455,121 @@ def main(logger:Log) -> None:
             os.remove(config.DB_PATH)  # Remove the database file if it exists, for testing purposes only
         shutil.copy2("/usr/local/bin/proxmox_rsync_seedbox/db/database.db", f"{config.DB_PATH}")
 
-    if(rsync.check_running_state()):
-        logger.error("Rsync is currently running. Exiting to avoid conflicts.")
-        exit(0)
+    resources = Resources(logger)
+    try:
+        run_cycle(logger, resources)
+    finally:
+        resources.close()
 
-    arr_service = Arr.Arr(logger = logger)
+def reload_config(logger:Log) -> Log:
+    """ Re-read .env into the config module. Keys .env set are dropped first, load_dotenv never override existing env """
+    for key in config.DOTENV_KEYS:
+        os.environ.pop(key, None)
+    importlib.reload(config)
+    logger.info("Configuration reloaded.")
+    return Log(config.VERBOSE)
 
-    # These queue should represent the torrents file name, not display name (they can be different such that file name might delimit by . but display name delimit by space)
-    sonarr_api_queue:list[Torrent] = arr_service.get_api_queue(config.SONARR_ENDPOINT, config.SONARR_API_KEY, Arr.SONARR)
-    radarr_api_queue:list[Torrent] = arr_service.get_api_queue(config.RADARR_ENDPOINT, config.RADARR_API_KEY, Arr.RADARR)
-    
-    ssh_conn = ssh.SSH(logger = logger,
-                    host = config.SEEDBOX_ENDPOINT,
-                    port = config.SEEDBOX_PORT,
-                    username = config.SEEDBOX_USERNAME)
-
-    # # These are imports pending in Arr and exists in seedbox, filtering so only remote seedbox torrent are included
-    sonarr_pending_import = ssh_conn.filter_seedbox_against_api(config.SEEDBOX_SONARR_TORRENT_PATH, sonarr_api_queue, ssh.SONARR)
-    logger.info("Sonarr pending import exists in Seedbox: %s", sonarr_pending_import)
-    radarr_pending_import = ssh_conn.filter_seedbox_against_api(config.SEEDBOX_RADARR_TORRENT_PATH, radarr_api_queue, ssh.RADARR)
-    logger.info("Radarr pending import exists in Seedbox: %s", radarr_pending_import)
-
-    # # Check against database if the torrent already tried import. Try a max of 3 times before giving up and send Discord message
-    db_engine = db.DB(logger)
-    db_engine = db_engine.get_engine()
-    db_query = db_queries.DB_Query(logger, db_engine)
-
-    # Mark torrent name not in API result list as complete.
-    # It either finish transfer or user cancel the import job in Activity Tab
-    db_query.mark_db_complete(sonarr_pending_import, db_queries.SONARR)
-    db_query.mark_db_complete(radarr_pending_import, db_queries.RADARR)
-
-    # If it does not exists in API anymore, it means the import is complete
-    db_query.purge_local_complete_content(config.SONARR_DEST_DIR, db_queries.SONARR)
-    db_query.purge_local_complete_content(config.RADARR_DEST_DIR, db_queries.RADARR)
-
-    # Only return list of full path seedbox torrents not in database (aka. new torrents)
-    sonarr_seedbox_torrent:list[Torrent] = db_query.check_torrents_and_get_full_path(sonarr_pending_import, config.SEEDBOX_SONARR_TORRENT_PATH, db_queries.SONARR)
-    radarr_seedbox_torrent:list[Torrent] = db_query.check_torrents_and_get_full_path(radarr_pending_import, config.SEEDBOX_RADARR_TORRENT_PATH, db_queries.RADARR)
-
-    rsync_util = rsync.Rsync(logger)
-
-    sonarr_rsync_status = False
-    sonarr_rsync_msg = ""
-    if len(sonarr_seedbox_torrent) > 0:
-        sonarr_rsync_status, sonarr_rsync_msg = rsync_util.transfer_from_remote(
-            user = config.SEEDBOX_USERNAME,
-            seedbox_endpoint = config.SEEDBOX_ENDPOINT,
-            port = config.SEEDBOX_PORT,
-            sources = sonarr_seedbox_torrent,
-            destination = config.SONARR_DEST_DIR,
-            arr_name = rsync.SONARR)
-    else:
-        logger.info("No Sonarr torrents to transfer.")
-
-    radarr_rsync_status = False
-    radarr_rsync_msg = ""
-    if len(radarr_seedbox_torrent) > 0:
-        radarr_rsync_status, radarr_rsync_msg = rsync_util.transfer_from_remote(
-            user = config.SEEDBOX_USERNAME,
-            seedbox_endpoint = config.SEEDBOX_ENDPOINT,
-            port = config.SEEDBOX_PORT,
-            sources = radarr_seedbox_torrent,
-            destination = config.RADARR_DEST_DIR,
-            arr_name=rsync.RADARR)
-    else:
-        logger.info("No Radarr torrents to transfer.")
+def daemon(logger:Log) -> None:
+    """
+    Long running mode. Engine, HTTP session and SSH transport stay warm across cycles.
+    Poll every DAEMON_MIN_INTERVAL seconds while anything is pending import, back off up to DAEMON_MAX_INTERVAL when idle.
+    With WEBHOOK_LISTEN set, Arr webhooks are handled between cycles right away and polling stays as the fallback.
+    SIGTERM/SIGINT finish the current cycle then exit, SIGHUP reload config before the next cycle.
+    """
+    from api import webhook
+    wake = threading.Event()
+    state = {"stop": False, "reload": False}
+    events:queue.Queue[webhook.WebhookEvent] = queue.Queue()
 
-    perm = permission.Permission()
-    perm.update_permission(config.SONARR_DEST_DIR, sonarr_seedbox_torrent, config.CHOWN_UID, config.CHOWN_GID, config.CHMOD)
-    perm.update_permission(config.RADARR_DEST_DIR, radarr_seedbox_torrent, config.CHOWN_UID, config.CHOWN_GID, config.CHMOD)
+    def on_stop(signum, _) -> None:
+        logger.info("Received signal %s, stopping after current cycle.", signum)
+        state["stop"] = True
+        wake.set()
 
-    # Only notify ones that has not been notified. Dont want to spam Discord
-    sonarr_need_notify = [torrent for torrent in sonarr_seedbox_torrent if not torrent.notified]
-    radarr_need_notify = [torrent for torrent in radarr_seedbox_torrent if not torrent.notified]
+    def on_reload(signum, _) -> None:
+        logger.info("Received signal %s, reloading configuration before next cycle.", signum)
+        state["reload"] = True
+        wake.set()
 
-    if len(sonarr_need_notify) == 0 and len(radarr_need_notify) == 0:
-        logger.info("No new torrents to transfer.")
-    elif len(sonarr_need_notify) > 0 or len(radarr_need_notify) > 0:
-        message = ""
-        severity = "message"
-
-        if len(sonarr_need_notify) > 0:
-            if sonarr_rsync_status:
-                logger.info(f"Transferred {len(sonarr_need_notify)} new Sonarr torrents.")
-                message += f"Transferred {len(sonarr_need_notify)} new Sonarr torrents:\n"
-                message += "\n".join(os.path.basename(torrent.path) for torrent in sonarr_need_notify) + "\n"
-            else:
-                logger.error(f"Transferred failed for Sonarr torrents with error message: {sonarr_rsync_msg}")
-                message += f"Transferred faild for Sonarr torrents with error message: {sonarr_rsync_msg}"
-                severity = "error"
-            for torrent in sonarr_need_notify:
-                db_query.set_notified(db_queries.SONARR, torrent)
-
-        if len(radarr_need_notify) > 0:
-            if radarr_rsync_status:
-                logger.info(f"Transferred {len(radarr_need_notify)} new Radarr torrents.")
-                message += f"Transferred {len(radarr_need_notify)} new Radarr torrents:\n"
-                message += "\n".join(os.path.basename(torrent.path) for torrent in radarr_need_notify) + "\n"
-            else:
-                logger.error(f"Transferred faild for Radarr torrents with error message: {radarr_rsync_msg}")
-                message += f"Transferred faild for Radarr torrents with error message: {radarr_rsync_msg}"
-                severity = "error"
-            for torrent in radarr_need_notify:
-                db_query.set_notified(db_queries.RADARR, torrent)
+    def on_event(event:webhook.WebhookEvent) -> None:
+        events.put(event)
+        wake.set()
+
+    def start_listener() -> webhook.WebhookServer | None:
+        if not config.WEBHOOK_LISTEN:
+            return None
+        if not config.WEBHOOK_TOKEN:
+            # Anyone reaching the port could post an import event and have local files purged
+            logger.error("WEBHOOK_LISTEN is set without WEBHOOK_TOKEN, webhook listener not started. Polling continues.")
+            return None
+        # /webhook/<instance name>, the single Sonarr/Radarr setup also keep /webhook/sonarr and /webhook/radarr
+        routes = {arr.name: arr for arr in resources.arr_instances}
+        for arr in resources.arr_instances:
+            routes.setdefault(arr.kind.value, arr)
+        server = webhook.WebhookServer(logger, config.WEBHOOK_LISTEN, config.WEBHOOK_TOKEN, routes, on_event)
+        server.start()
+        return server
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGHUP, on_reload)
+
+    resources = Resources(logger)
+    listener = start_listener()
+    interval = config.DAEMON_MIN_INTERVAL
+    next_cycle = time.monotonic()
+    try:
+        while not state["stop"]:
+            if state["reload"]:
+                state["reload"] = False
+                logger = reload_config(logger)
+                # Endpoints or credentials might have changed, rebuild everything
+                if listener is not None:
+                    listener.close()
+                resources.close()
+                resources = Resources(logger)
+                listener = start_listener()
+                interval = config.DAEMON_MIN_INTERVAL
+                next_cycle = time.monotonic()
 
-        if config.NOTIFICATION_SERVICE and config.NOTIFICATION_SERVICE.lower() == "apprise":
-            notification.Notification(logger, config.WEBHOOK_URL, notification.APPRISE).send_notification(message, severity)
-        elif config.NOTIFICATION_SERVICE and config.NOTIFICATION_SERVICE.lower() == "discord":
-            notification.Notification(logger, config.WEBHOOK_URL, notification.DISCORD).send_notification(message, severity)
+            if time.monotonic() >= next_cycle:
+                try:
+                    pending = run_cycle(logger, resources)
+                except Exception as e:
+                    # One bad cycle (Arr down, seedbox unreachable) should not kill the daemon
+                    logger.error("Cycle failed: %s", e, exc_info = True)
+                    pending = 0
+
+                if pending > 0:
+                    interval = config.DAEMON_MIN_INTERVAL
+                else:
+                    interval = min(interval * 2, config.DAEMON_MAX_INTERVAL)
+                next_cycle = time.monotonic() + interval
+                logger.debug("%s torrents pending import, next cycle in %s seconds.", pending, interval)
+
+            # Clear before draining so an event arriving mid-drain still wakes the next wait
+            wake.clear()
+            while not events.empty():
+                event = events.get_nowait()
+                try:
+                    handle_webhook_event(logger, resources, event)
+                except Exception as e:
+                    logger.error("Webhook %s for %s failed, polling will pick it up: %s", event.event_type, event.download_id, e, exc_info = True)
+                if event.event_type == "Grab":
+                    # Something new is on its way, go back to tight polling
+                    interval = config.DAEMON_MIN_INTERVAL
+                    next_cycle = min(next_cycle, time.monotonic() + interval)
+
+            wake.wait(max(0.0, next_cycle - time.monotonic()))
+    finally:
+        if listener is not None:
+            listener.close()
+        resources.close()
 
 if __name__ == "__main__":
-    main(Log(config.VERBOSE))
+    parser = argparse.ArgumentParser(description = "Sync pending Sonarr/Radarr imports from seedbox.")
+    parser.add_argument("--daemon", action = "store_true", help = "Run continuously with adaptive polling instead of a single run")
+    args = parser.parse_args()
+
+    # PROFILE=cprofile|tracemalloc writes a report next to log/app.log
+    run_profiled(config.PROFILE, daemon if args.daemon else main, Log(config.VERBOSE))
@@ -0,0 +1,128 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+PREFIX = "rsync_seedbox"
+
+# name: (type, help), every metric written to the textfile must be declared here
+METRICS: dict[str, tuple[str, str]] = {
+    "stage_duration_seconds": ("gauge", "Wall time of each pipeline stage in the last run"),
+    "queue_size": ("gauge", "Importable torrents returned by the Arr queue"),
+    "pending_import": ("gauge", "Importable torrents that exist on the seedbox"),
+    "items_transferred": ("gauge", "Torrents transferred successfully in the last run"),
+    "items_failed": ("gauge", "Torrents whose transfer failed in the last run"),
+    "items_detached": ("gauge", "Torrents handed to a background rsync in the last run, counted once reaped"),
+    "items_purged": ("gauge", "Local torrents purged after import in the last run"),
+    "bytes_transferred": ("gauge", "Bytes moved by rsync in the last run"),
+    "rsync_exit_code": ("gauge", "Torrents per rsync exit code in the last run"),
+    "http_requests": ("gauge", "HTTP requests in the last run by host and status, every retry counts"),
+    "http_request_seconds": ("gauge", "Time spent in HTTP requests in the last run by host"),
+    "log_messages": ("gauge", "Log records emitted in the last run by level"),
+    "run_duration_seconds": ("gauge", "Wall time of the last run"),
+    "run_success": ("gauge", "1 if the last run finished without an exception"),
+    "last_run_timestamp_seconds": ("gauge", "Unix time the last run finished"),
+    "last_success_timestamp_seconds": ("gauge", "Unix time of the last successful run"),
+}
+
+class _LogCounter(logging.Handler):
+    """ Count log records per level so the textfile shows how noisy a run was """
+    def __init__(self) -> None:
+        super().__init__(level = logging.DEBUG)
+        self.counts: dict[str, int] = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        level = record.levelname.lower()
+        self.counts[level] = self.counts.get(level, 0) + 1
+
+class Metrics:
+    """
+        Collect per run metrics and write a node_exporter textfile collector file at the end of the run.
+        Arr pipelines record from different threads, every write goes through one lock.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: dict[str, dict[tuple[tuple[str, str], ...], float]] = {}
+        self._start = time.time()
+        self._log_counter = _LogCounter()
+        logging.getLogger().addHandler(self._log_counter)
+
+    @contextmanager
+    def stage(self, stage: str, arr: str = "") -> Iterator[None]:
+        """ Time a block as stage_duration_seconds{stage, arr}, a stage entered twice adds up """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.inc("stage_duration_seconds", time.monotonic() - start, stage = stage, arr = arr)
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values.setdefault(name, {})[self._key(labels)] = value
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            key = self._key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def _key(self, labels: dict[str, str]) -> tuple[tuple[str, str], ...]:
+        return tuple(sorted((label, str(value)) for (label, value) in labels.items() if value != ""))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for (name, series) in self._values.items():
+                (metric_type, help_text) = METRICS[name]
+                lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+                lines.append(f"# TYPE {PREFIX}_{name} {metric_type}")
+                for (labels, value) in series.items():
+                    label_str = ",".join(f'{label}="{self._escape(label_value)}"' for (label, label_value) in labels)
+                    lines.append(f"{PREFIX}_{name}{{{label_str}}} {self._format(value)}" if label_str else f"{PREFIX}_{name} {self._format(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _format(self, value: float) -> str:
+        # Keep full precision, timestamps and byte counts must not be rounded
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+    def _escape(self, value: str) -> str:
+        return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    def _previous_success(self, path: str) -> float | None:
+        # Failed run should not reset last success, carry it over from the previous file
+        try:
+            with open(path, encoding = "utf-8") as file:
+                for line in file:
+                    if line.startswith(f"{PREFIX}_last_success_timestamp_seconds "):
+                        return float(line.split()[1])
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    def close(self) -> None:
+        """ Stop counting log records. Safe to call twice, must run whether or not the textfile is written """
+        logging.getLogger().removeHandler(self._log_counter)
+
+    def write(self, path: str, success: bool) -> None:
+        """
+        Finish the run and write the textfile.
+        Written to a temp file then renamed, node_exporter must never read a half written file
+        """
+        self.close()
+        now = time.time()
+        for (level, count) in self._log_counter.counts.items():
+            self.set("log_messages", count, level = level)
+        self.set("run_duration_seconds", now - self._start)
+        self.set("run_success", 1 if success else 0)
+        self.set("last_run_timestamp_seconds", now)
+
+        last_success = now if success else self._previous_success(path)
+        if last_success is not None:
+            self.set("last_success_timestamp_seconds", last_success)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding = "utf-8") as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
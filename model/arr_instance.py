@@ -0,0 +1,28 @@
+import os
+from enum import Enum
+
+class ARR(Enum):
+    """ Kind of Arr, decides the queue model and which DB table an instance's torrents live in """
+    SONARR = "sonarr"
+    RADARR = "radarr"
+
+SONARR = ARR.SONARR
+RADARR = ARR.RADARR
+
+class ArrInstance():
+    """
+        One configured Sonarr/Radarr with its own endpoint, seedbox directory and local destination.
+        name identifies the instance in DB rows, lock files and the webhook URL, so it must stay stable once used
+    """
+    def __init__(self, name:str, kind:ARR, endpoint:str, api_key:str, seedbox_path:str, dest_dir:str, category:str = "", label:str = "") -> None:
+        self.name = name
+        self.kind = kind
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.seedbox_path = seedbox_path
+        self.dest_dir = dest_dir
+        # Path segment in Arr's outputPath right above the torrent root, the seedbox directory name unless told otherwise
+        self.category = category if category else os.path.basename(seedbox_path.rstrip("/"))
+        # Display name in logs and notifications
+        self.label = label if label else name
+
@@ -0,0 +1,131 @@
+class PathIndex():
+    """
+        Seedbox entries keyed by path components, a hash set for exact lookups plus a prefix trie.
+        Lookups walk one trie level per component, O(depth) whatever the queue or listing size.
+        Entries are relative to the seedbox directory, nested ones (a category subfolder's content) are added as they get listed
+    """
+    # Marks a trie node that is an entry itself, a component can never be empty so it cannot clash with a child
+    _ENTRY = ""
+
+    def __init__(self) -> None:
+        self._entries:dict[str, bool] = {}
+        self._trie:dict = {}
+
+    @classmethod
+    def from_entries(cls, entries:dict, prefix:str = "") -> "PathIndex":
+        """
+        Args:
+            entries(dict): name -> tuple starting with is_dir, as returned by SSH.list_entries
+        """
+        index = cls()
+        index.add_entries(entries, prefix)
+        return index
+
+    def add_entries(self, entries:dict, prefix:str = "") -> None:
+        """
+        Children of the directory prefix ("" for the seedbox directory itself).
+        A listed directory is a folder of entries (a category subfolder), it stops being an entry itself and nothing resolves to it anymore
+        """
+        self._remove(prefix)
+        for (name, entry) in entries.items():
+            self.add(f"{prefix}/{name}" if prefix else name, entry[0])
+
+    def add(self, path:str, is_dir:bool) -> None:
+        components = self._split(path)
+        if len(components) == 0:
+            return
+        node = self._trie
+        for component in components:
+            node = node.setdefault(component, {})
+        node[self._ENTRY] = is_dir
+        self._entries["/".join(components)] = is_dir
+
+    def __contains__(self, path:str) -> bool:
+        return "/".join(self._split(path)) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def is_dir(self, path:str) -> bool:
+        return self._entries.get("/".join(self._split(path)), False)
+
+    def resolve(self, path:str, anchor:str = "") -> str | None:
+        """
+        The entry path is, Arr outputPath is the torrent content root so nothing shorter may stand in for it:
+        a category subfolder (anime for anime/Show.S02) would otherwise take every release under it along.
+        Arr paths are cut at the first category folder, a nested folder with the same name (e.g. tv-sonarr/downloads/tv-sonarr/Show) needs another try
+
+        Returns:
+            str | None: matching entry path, None when nothing matches from any start
+        """
+        return next((candidate for candidate in self._candidates(path, anchor) if candidate in self._entries), None)
+
+    def unlisted(self, path:str, anchor:str = "") -> list[str]:
+        """
+        Returns:
+            list[str]: for every start path does not resolve from, the deepest indexed directory above it.
+                Its children have to be listed (and added) before path can resolve, e.g. "anime" for "anime/Show.S02"
+        """
+        parents = []
+        for candidate in self._candidates(path, anchor):
+            if candidate in self._entries:
+                return []
+            parent = self._deepest_dir(candidate)
+            if parent is not None:
+                parents.append(parent)
+        return parents
+
+    def root_of(self, path:str, anchor:str = "") -> str | None:
+        """
+        For an index of torrent roots: the one path is equal to or nested in, e.g. "Show" for "Show/Season 01/ep.mkv".
+        Tried from the same starts as resolve
+
+        Returns:
+            str | None: shortest indexed entry path starts with, None when nothing matches
+        """
+        for candidate in self._candidates(path, anchor):
+            components = self._split(candidate)
+            node = self._trie
+            for (depth, component) in enumerate(components):
+                node = node.get(component)
+                if node is None:
+                    break
+                if self._ENTRY in node:
+                    return "/".join(components[:depth + 1])
+        return None
+
+    def _remove(self, path:str) -> None:
+        components = self._split(path)
+        node = self._trie
+        for component in components:
+            node = node.get(component)
+            if node is None:
+                return
+        if len(components) > 0:
+            node.pop(self._ENTRY, None)
+            self._entries.pop("/".join(components), None)
+
+    def _deepest_dir(self, path:str) -> str | None:
+        # Deepest indexed directory strictly above path
+        components = self._split(path)
+        node = self._trie
+        found = None
+        for (depth, component) in enumerate(components[:-1]):
+            node = node.get(component)
+            if node is None:
+                break
+            if node.get(self._ENTRY):
+                found = "/".join(components[:depth + 1])
+        return found
+
+    def _candidates(self, path:str, anchor:str) -> list[str]:
+        # Whole path first, then what follows each later anchor component
+        components = self._split(path)
+        candidates = ["/".join(components)]
+        if anchor:
+            candidates.extend("/".join(components[idx + 1:]) for (idx, component) in enumerate(components) if component == anchor and idx + 1 < len(components))
+        return candidates
+
+    def _split(self, path:str) -> list[str]:
+        # Arr paths can carry doubled or trailing slashes, "." segments never name anything
+        return [component for component in path.split("/") if component not in ("", ".")]
@@ -1,9 +1,21 @@
 class Torrent():
-    def __init__(self, path: str, is_dir: bool, notified:bool = False):
+    def __init__(self, path: str, is_dir: bool, notified:bool = False, size:int = 0):
         self._path = path
         self._full_path = None
         self._is_dir = is_dir
         self._notified = notified
+        self._size = size
+        self._transferred = False
+        self._transfer_error = ""
+        self._bytes_transferred = 0
+        self._transfer_seconds = 0.0
+        self._exit_code: int | None = None
+        self._lock_fd: int | None = None
+        self._detached = False
+        self._pid: int | None = None
+        self._log_file = ""
+        self._status_file = ""
+        self._local_bytes = 0
 
     @property
     def path(self):
@@ -36,3 +48,104 @@ class Torrent():
     @notified.setter
     def notified(self, notified:bool):
         self._notified = notified
+
+    @property
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, size:int):
+        self._size = size
+
+    @property
+    def transferred(self):
+        return self._transferred
+
+    @transferred.setter
+    def transferred(self, transferred:bool):
+        self._transferred = transferred
+
+    @property
+    def transfer_error(self):
+        return self._transfer_error
+
+    @transfer_error.setter
+    def transfer_error(self, transfer_error:str):
+        self._transfer_error = transfer_error
+
+    @property
+    def bytes_transferred(self):
+        return self._bytes_transferred
+
+    @bytes_transferred.setter
+    def bytes_transferred(self, bytes_transferred:int):
+        self._bytes_transferred = bytes_transferred
+
+    @property
+    def transfer_seconds(self):
+        return self._transfer_seconds
+
+    @transfer_seconds.setter
+    def transfer_seconds(self, transfer_seconds:float):
+        self._transfer_seconds = transfer_seconds
+
+    @property
+    def transfer_rate(self) -> float:
+        # Average bytes per second over the whole transfer
+        return self._bytes_transferred / self._transfer_seconds if self._transfer_seconds > 0 else 0.0
+
+    @property
+    def exit_code(self):
+        return self._exit_code
+
+    @exit_code.setter
+    def exit_code(self, exit_code:int | None):
+        self._exit_code = exit_code
+
+    @property
+    def lock_fd(self):
+        return self._lock_fd
+
+    @lock_fd.setter
+    def lock_fd(self, lock_fd:int | None):
+        self._lock_fd = lock_fd
+
+    @property
+    def detached(self):
+        return self._detached
+
+    @detached.setter
+    def detached(self, detached:bool):
+        self._detached = detached
+
+    @property
+    def pid(self):
+        return self._pid
+
+    @pid.setter
+    def pid(self, pid:int | None):
+        self._pid = pid
+
+    @property
+    def log_file(self):
+        return self._log_file
+
+    @log_file.setter
+    def log_file(self, log_file:str):
+        self._log_file = log_file
+
+    @property
+    def status_file(self):
+        return self._status_file
+
+    @status_file.setter
+    def status_file(self, status_file:str):
+        self._status_file = status_file
+
+    @property
+    def local_bytes(self):
+        return self._local_bytes
+
+    @local_bytes.setter
+    def local_bytes(self, local_bytes:int):
+        self._local_bytes = local_bytes
@@ -1,24 +1,28 @@
+import os
+import shlex
+import subprocess
+import threading
 import paramiko
-from enum import Enum
 from log.log import Log
+from log.trace import traced
+from model.arr_instance import ArrInstance, SONARR, RADARR
+from model.path_index import PathIndex
 from model.torrent import Torrent
 
-class ARR(Enum):
-    SONARR = "tv-sonarr"
-    RADARR = "radarr"
+# name -> (is_dir, apparent size in bytes or None when not known yet, find %T@ mtime)
+Entries = dict[str, tuple[bool, int | None, str]]
 
-SONARR = ARR.SONARR
-RADARR = ARR.RADARR
-
-class FILETYPE(Enum):
-    DIR = "Dir"
-    FILE = "File"
-
-DIR = FILETYPE.DIR
-FILE = FILETYPE.FILE
+# du arguments per remote command, keeps the command line well under ARG_MAX
+DU_CHUNK_SIZE = 200
 
 class SSH:
-    def __init__(self, logger:Log, host:str, port:int, username:str) -> None:
+    """
+        One SSH transport per run.
+        Paramiko session is opened lazily on first remote command and reused for every command after that,
+        rsync piggybacks on an OpenSSH ControlMaster socket so it does not pay another handshake per transfer.
+        Use as a context manager (or call close()) so both are torn down on every exit path.
+    """
+    def __init__(self, logger:Log, host:str, port:int, username:str, control_path:str = "", control_persist:str = "60") -> None:
         self.logger = logger
 
         if host is None or username is None or port is None:
@@ -27,59 +31,288 @@ class SSH:
         self.host:str = host
         self.username:str = username
         self.port:int = port
-    
-    def _list(self, path:str, filetype: FILETYPE, arr_type: ARR) -> list[str]:
-        options = ["-type d"] if filetype == DIR else ["-type f"]
-        options.append("-maxdepth 1")
+
+        # %C is a hash of local host, remote host, port and user, keeps socket path short (unix socket path limit is ~104 chars)
+        self.control_path:str = control_path if control_path else os.path.join(os.path.expanduser("~"), ".ssh", "cm-%C")
+        self.control_persist:str = control_persist
+        self._client: paramiko.SSHClient | None = None
+        self._master_started = False
+        # Arr pipelines share this transport from different threads
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "SSH":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _get_client(self) -> paramiko.SSHClient:
+        with self._lock:
+            return self._connect()
+
+    def _connect(self) -> paramiko.SSHClient:
+        # Reuse authenticated session if transport is still alive, otherwise reconnect once
+        if self._client is not None:
+            transport = self._client.get_transport()
+            if transport is not None and transport.is_active():
+                return self._client
+            self.logger.info("SSH transport to %s is no longer active, reconnecting.", self.host)
+            self._client.close()
 
         client = paramiko.SSHClient()
         client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         client.connect(self.host, port=self.port, username=self.username)
+        transport = client.get_transport()
+        if transport is not None:
+            # Keep NAT/firewall from dropping an idle session between stages
+            transport.set_keepalive(30)
+        self._client = client
+        return client
+
+    @traced()
+    def exec_command(self, cmd:str) -> tuple[list[str], list[str]]:
+        """
+        Run a command over the shared paramiko session
 
-        cmd = f'find {path} {" ".join(options)}'
+        Returns:
+            tuple(list[str], list[str]): stdout lines and stderr lines
+        """
+        (out, err) = self._exec_raw(cmd)
+        return (out.decode().splitlines(), err.decode().splitlines())
+
+    def _exec_raw(self, cmd:str) -> tuple[bytes, bytes]:
+        """ Undecoded stdout and stderr, for NUL separated output """
         self.logger.debug("Executing remote command: %s", cmd)
-        _, stdout, stderr = client.exec_command(cmd)
+        _, stdout, stderr = self._get_client().exec_command(cmd)
+        return (stdout.read(), stderr.read())
 
-        if len(stderr.readlines()) != 0:
-            self.logger.error("Error from Paramiko: %s", stderr.readlines())
-            return []
-        else:
-            listing = stdout.read().decode().splitlines()
-            
-            client.close()
-            # Only get relative path, and remove prepending /
-            listing = [item.strip().split(arr_type.value)[1][1:] for item in listing]
-            # find ./ -type d -maxdepth 1 have first entry of dir itself, remove relative path of ""
-            # find ./ -type f -maxdepth 1 does not have this issue
-            return [item for item in listing if item.strip() != ""]
-
-    def filter_seedbox_against_api(self, arr_path:str, api_queue: list[Torrent], arr_name: ARR) -> list[Torrent]:
+    def get_rsync_shell(self) -> str:
+        """
+        Remote shell command for rsync -e, multiplexed over a ControlMaster socket.
+        First rsync to connect becomes the master, every other one reuses it.
+        """
+        self._master_started = True
+        return " ".join(["ssh",
+                         "-p", str(self.port),
+                         "-o", "ControlMaster=auto",
+                         "-o", f"ControlPath={self.control_path}",
+                         "-o", f"ControlPersist={self.control_persist}"])
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+        if self._master_started:
+            # "stop" instead of "exit", master stop accepting new sessions but background rsync keep running until done
+            try:
+                subprocess.run(["ssh",
+                                "-p", str(self.port),
+                                "-o", f"ControlPath={self.control_path}",
+                                "-O", "stop",
+                                f"{self.username}@{self.host}"],
+                               capture_output=True, timeout=10)
+            except (OSError, subprocess.SubprocessError) as e:
+                self.logger.debug("Unable to stop SSH control master: %s", e)
+            self._master_started = False
+
+    @traced()
+    def list_entries(self, path:str, cached_mtime:str = "") -> tuple[str, Entries | None]:
+        """
+        One round trip for the directory mtime and every direct child with its type, size and mtime.
+        Children are only listed when the directory mtime differs from cached_mtime.
+
+        Returns:
+            tuple(str, Entries | None): directory mtime and its entries, entries is None when unchanged. ("", None) on error
+        """
+        quoted = shlex.quote(path)
+        cmd = (f"m=$(find {quoted} -maxdepth 0 -printf '%T@') && printf '%s\\0' \"$m\" && "
+               f"[ \"$m\" != {shlex.quote(cached_mtime)} ] && "
+               f"find {quoted} -mindepth 1 -maxdepth 1 \\( -type d -o -type f \\) -printf '%y\\t%s\\t%T@\\t%f\\0'")
+        (out, err) = self._exec_raw(cmd)
+
+        if len(err) != 0:
+            self.logger.error("Error from Paramiko: %s", err.decode(errors = "replace").splitlines())
+            return ("", None)
+
+        # Names can hold anything but NUL and /, so records are NUL separated and the name is the last tab field
+        records = out.decode(errors = "replace").split("\0")
+        mtime = records[0]
+        if mtime == "":
+            self.logger.error("Unable to read mtime of seedbox directory %s", path)
+            return ("", None)
+        if mtime == cached_mtime:
+            return (mtime, None)
+
+        entries:Entries = {}
+        for record in records[1:]:
+            if record == "":
+                continue
+            (filetype, size, entry_mtime, name) = record.split("\t", 3)
+            # Directory size is only its inode, real content size comes from du
+            entries[name] = (filetype == "d", None if filetype == "d" else int(size), entry_mtime)
+        return (mtime, entries)
+
+    @traced()
+    def get_sizes(self, path:str, names:list[str]) -> dict[str, int]:
+        """
+        Returns:
+            dict(str, int): apparent size in bytes of each name under path, missing names are left out
+        """
+        sizes:dict[str, int] = {}
+        for idx in range(0, len(names), DU_CHUNK_SIZE):
+            chunk = names[idx:idx + DU_CHUNK_SIZE]
+            cmd = f"cd {shlex.quote(path)} && du -0 -sb -- {' '.join(shlex.quote(name) for name in chunk)}"
+            (out, err) = self._exec_raw(cmd)
+            if len(err) != 0:
+                self.logger.error("Error from Paramiko: %s", err.decode(errors = "replace").splitlines())
+            for record in out.decode(errors = "replace").split("\0"):
+                if record == "":
+                    continue
+                (size, name) = record.split("\t", 1)
+                sizes[name] = int(size)
+        return sizes
+
+    @traced()
+    def get_manifest(self, path:str, names:list[str]) -> dict[str, dict[str, int]]:
+        """
+        Every regular file under each name in path with its size, one find per chunk of names.
+
+        Returns:
+            dict(str, dict[str, int]): name -> {path relative to name ("" for a single file torrent): size}, missing names are left out
+        """
+        manifest:dict[str, dict[str, int]] = {}
+        for idx in range(0, len(names), DU_CHUNK_SIZE):
+            chunk = names[idx:idx + DU_CHUNK_SIZE]
+            top_level = set(chunk)
+            # ./ prefix so a name starting with - is not taken as a find option
+            cmd = f"cd {shlex.quote(path)} && find {' '.join(shlex.quote('./' + name) for name in chunk)} -type f -printf '%p\\t%s\\0'"
+            (out, err) = self._exec_raw(cmd)
+            if len(err) != 0:
+                self.logger.error("Error from Paramiko: %s", err.decode(errors = "replace").splitlines())
+            for record in out.decode(errors = "replace").split("\0"):
+                if record == "":
+                    continue
+                (file_path, size) = record.rsplit("\t", 1)
+                file_path = file_path[2:]
+                # Torrent names are top level entries, only a nested name needs the prefix scan
+                name = file_path.split("/")[0]
+                if name not in top_level:
+                    name = next((name for name in chunk if file_path == name or file_path.startswith(name + "/")), "")
+                if name:
+                    manifest.setdefault(name, {})[file_path[len(name) + 1:]] = int(size)
+        return manifest
+
+    @traced()
+    def get_gone(self, path:str, names:list[str]) -> set[str]:
+        """
+        Names under path confirmed removed: the directory holding each one listed fine and it is not in there.
+
+        Returns:
+            set(str): names that are gone, a name whose directory could not be listed is never in it
+        """
+        by_parent:dict[str, list[str]] = {}
+        for name in names:
+            (parent, _, base) = name.rpartition("/")
+            by_parent.setdefault(parent, []).append(base)
+
+        gone:set[str] = set()
+        for (parent, bases) in by_parent.items():
+            (_, entries) = self.list_entries(os.path.join(path, parent) if parent else path)
+            if entries is not None:
+                gone.update(f"{parent}/{base}" if parent else base for base in bases if base not in entries)
+        return gone
+
+    def _get_listing(self, path:str, cache) -> Entries:
+        """
+        Seedbox listing of path, served from cache while the directory mtime is unchanged.
+
+        Args:
+            cache(DB_Query | None): Provides get_seedbox_listing and save_seedbox_listing, None to always list
+        """
+        (cached_mtime, cached_entries) = cache.get_seedbox_listing(path) if cache is not None else ("", {})
+        (mtime, entries) = self.list_entries(path, cached_mtime)
+        if entries is None:
+            if mtime == "":
+                return {}
+            self.logger.debug("Seedbox %s unchanged since last listing, using %s cached entries", path, len(cached_entries))
+            return cached_entries
+
+        # Directory mtime does not cover its nested content, only carry a du size over while the entry itself is untouched
+        for (name, (is_dir, _, entry_mtime)) in entries.items():
+            cached = cached_entries.get(name)
+            if is_dir and cached is not None and cached[0] and cached[2] == entry_mtime:
+                entries[name] = (True, cached[1], entry_mtime)
+
+        self.logger.debug("Listed %s entries in seedbox %s", len(entries), path)
+        if cache is not None:
+            cache.save_seedbox_listing(path, mtime, entries)
+        return entries
+
+    @traced()
+    def filter_seedbox_against_api(self, arr: ArrInstance, api_queue: list[Torrent], cache = None) -> list[Torrent]:
         """
         Filters the API queue against the files in the specified path on the remote server.
         Returns a list of items that are in both the API queue and the remote directory.
+
+        Args:
+            cache(DB_Query | None): Seedbox listing cache, None to list the directory every time
         """
-        if arr_name not in [SONARR, RADARR]:
-            self.logger.error("Unsupported ARR service: %s", arr_name)
+        if arr.kind not in [SONARR, RADARR]:
+            self.logger.error("Unsupported ARR service: %s", arr.kind)
             return []
+        arr_path = arr.seedbox_path
 
-        result = api_queue.copy()
+        # Getting seedbox dir and files, indexed once for every queue record
+        entries = self._get_listing(arr_path, cache)
+        index = PathIndex.from_entries(entries)
 
-        # Getting seedbox dir and files
-        seedbox_arr_dir = self._list(arr_path, DIR, arr_name)
-        seedbox_arr_file = self._list(arr_path, FILE, arr_name)
+        # A record below a directory of the listing (a category subfolder like anime/Show.S02) only resolves once that directory is listed too,
+        # the subfolder itself is never taken for the torrent
+        listed:set[str] = set()
+        while True:
+            parents = {parent for torrent in api_queue for parent in index.unlisted(torrent.path, arr.category)} - listed
+            if len(parents) == 0:
+                break
+            for parent in sorted(parents):
+                listed.add(parent)
+                children = self._get_listing(os.path.join(arr_path, parent), cache)
+                index.add_entries(children, parent)
+                entries.update({f"{parent}/{name}": entry for (name, entry) in children.items()})
 
-        self.logger.debug("Seedbox %s dir: %s", arr_name.value, seedbox_arr_dir)
-        self.logger.debug("Seedbox %s file: %s", arr_name.value, seedbox_arr_file)
-        self.logger.debug("local sonarr: %s", api_queue)
+        self.logger.debug("Seedbox %s entries: %s", arr.name, len(index))
+        self.logger.debug("local %s: %s", arr.name, api_queue)
 
-        # Fine tune is_dir parameter
+        # Resolve each record to its torrent root and fine tune is_dir.
+        # Not found ones are kept as they are, a failed listing must not make everything look imported
+        resolved:dict[str, Torrent] = {}
+        for torrent in api_queue:
+            root = index.resolve(torrent.path, arr.category)
+            if root is not None:
+                torrent.path = root
+                torrent.is_dir = index.is_dir(root)
+            else:
+                self.logger.debug("Cannot find %s in remote %s file nor dir", torrent.path, arr.name)
+            # Files of one season pack resolve to the same torrent, it is transferred once
+            if torrent.path not in resolved:
+                resolved[torrent.path] = torrent
+        result = list(resolved.values())
+
+        # Real byte counts for transfer planning, du only runs for matched directories not sized yet
+        unsized = list(dict.fromkeys(torrent.path for torrent in result if torrent.path in entries and entries[torrent.path][1] is None))
+        if len(unsized) > 0:
+            sizes = self.get_sizes(arr_path, unsized)
+            by_listing:dict[str, dict[str, int]] = {}
+            for (name, size) in sizes.items():
+                entries[name] = (entries[name][0], size, entries[name][2])
+                (parent, _, base) = name.rpartition("/")
+                by_listing.setdefault(parent, {})[base] = size
+            if cache is not None:
+                # Cached per listed directory, a nested entry belongs to its subfolder's listing
+                for (parent, parent_sizes) in by_listing.items():
+                    cache.set_seedbox_sizes(os.path.join(arr_path, parent) if parent else arr_path, parent_sizes)
         for torrent in result:
-            potential_path = torrent.path.split("/")[0]
-            if potential_path in seedbox_arr_dir:
-                torrent.is_dir = True
-                torrent.path = potential_path
-            elif potential_path in seedbox_arr_file:
-                torrent.is_dir = False
-            self.logger.debug("Cannot find %s in remote %s file nor dir")
-        
+            if torrent.path in entries:
+                torrent.size = entries[torrent.path][1] or 0
+
         return result